@@ -35,10 +35,6 @@ def browse_dir(path: str):
         "files": sorted(files, key=lambda x: x["name"])
     }
 
-def _generate_task_id():
-    import time, random
-    return f"task_{int(time.time())}_{random.randint(1000,9999)}"
-
 def main():
     parser = argparse.ArgumentParser(description="Linux-side helper CLI for Windows downloader")
     sub = parser.add_subparsers(dest="cmd", required=True)
@@ -61,15 +57,22 @@ def main():
     sync_folder.add_argument("--target-dir", required=True, help="Local Linux target directory for downloads")
     sync_folder.add_argument("--after", type=int, default=None, help="Only download files modified after this UNIX timestamp")
     sync_folder.add_argument("--created-by", default="windows_user", help="Created by identifier")
+    sync_folder.add_argument("--chunk-concurrency", type=int, default=None, help="Concurrent range requests per object (overrides daemon default)")
+    sync_folder.add_argument("--small-threshold", type=int, default=None, help="Objects below this many bytes are downloaded as one batch task (0 disables)")
+    sync_folder.add_argument("--force", action="store_true", help="Download every object, even if an identical local copy exists")
+    sync_folder.add_argument("--priority", type=int, default=0, help="Task priority; higher runs first and may preempt lower-priority running tasks (default 0)")
     
     # list command (for listing tasks)
     list_cmd = sub.add_parser("list", help="List all tasks")
+    list_cmd.add_argument("--by-user", action="store_true", help="Show per-user queue depth instead of the tasks")
     
     # download command
-    download = sub.add_parser("download", help="Download a single file")
-    download.add_argument("--object-key", required=True, help="OBS object key")
+    download = sub.add_parser("download", help="Download one or more files")
+    download.add_argument("--object-key", required=True, nargs="+", help="OBS object key (several keys create one task each)")
     download.add_argument("--target-dir", required=True, help="Local target directory")
     download.add_argument("--created-by", default="windows_user", help="Created by identifier")
+    download.add_argument("--chunk-concurrency", type=int, default=None, help="Concurrent range requests for this object (overrides daemon default)")
+    download.add_argument("--priority", type=int, default=0, help="Task priority; higher runs first and may preempt lower-priority running tasks (default 0)")
     
     # status command
     status = sub.add_parser("status", help="Get task status")
@@ -97,6 +100,12 @@ def main():
     favorites.add_argument("--name", default="", help="Favorite name")
     favorites.add_argument("--path", default="", help="Favorite path")
     
+    # rate-limit command
+    rate_limit = sub.add_parser("rate-limit", help="Show or change daemon bandwidth limits at runtime")
+    rate_limit.add_argument("--global-mbps", type=float, default=None, help="Daemon-wide limit in MB/s (0 = unlimited)")
+    rate_limit.add_argument("--user", default=None, help="created_by user to limit ('default' applies to all users)")
+    rate_limit.add_argument("--mbps", type=float, default=None, help="Limit for --user in MB/s (0 = unlimited)")
+    
     # browse-obs command
     browse_obs = sub.add_parser("browse-obs", help="Get OBS directory tree")
     browse_obs.add_argument("--bucket", default="tfds-ht", help="OBS bucket name")
@@ -132,44 +141,70 @@ def main():
         target_dir = getattr(args, 'target_dir')
         after = getattr(args, 'after', None)
         created_by = getattr(args, 'created_by', 'windows_user')
-        task_ids = batch_create_tasks(bucket, prefix, target_dir, created_by, after_ts=after)
-        print(json.dumps({"tasks": task_ids}))
+        chunk_concurrency = getattr(args, 'chunk_concurrency', None)
+        small_threshold = getattr(args, 'small_threshold', None)
+        kwargs = {}
+        if small_threshold is not None:
+            kwargs["small_threshold"] = small_threshold
+        report = {}
+        task_ids = batch_create_tasks(bucket, prefix, target_dir, created_by, after_ts=after,
+                                      chunk_concurrency=chunk_concurrency,
+                                      skip_identical=not getattr(args, 'force', False),
+                                      report=report, priority=getattr(args, 'priority', 0), **kwargs)
+        print(json.dumps(dict({"tasks": task_ids}, **report)))
         sys.exit(0)
     
     if args.cmd == "list":
         from linux_server.task_manager import TaskManager
         tm = TaskManager()
+        if args.by_user:
+            print(json.dumps({"users": tm.queue_depth_by_user()}))
+            sys.exit(0)
         tasks = tm.list_tasks()
         print(json.dumps(tasks))
         sys.exit(0)
     
     if args.cmd == "download":
-        object_key = getattr(args, 'object_key', None)
+        object_keys = getattr(args, 'object_key', None) or []
         target_dir = getattr(args, 'target_dir', None)
         created_by = getattr(args, 'created_by', 'windows_user')
         
-        if not object_key or not target_dir:
+        if not object_keys or not target_dir:
             print(json.dumps({"error": "object_key and target_dir are required"}))
             sys.exit(2)
         
         from linux_server.task_manager import TaskManager
         tm = TaskManager()
-        task_id = _generate_task_id()
-        data = {
-            "id": task_id,
-            "type": "single_file",
-            "object_key": object_key,
-            "target_dir": target_dir,
-            "bucket": "tfds-ht",
-            "created_by": created_by,
-            "created_at": int(__import__('time').time()),
-            "status": "pending",
-            "total_size": 0,
-            "piece_size": 4 * 1024 * 1024,
-            "progress": {"downloaded": 0, "total": 0, "percentage": 0},
-        }
-        tm.add_task(task_id, data)
-        print(json.dumps({"task_id": task_id, "status": "pending"}))
+        chunk_concurrency = getattr(args, 'chunk_concurrency', None)
+        tasks = []
+        used_ids = set()
+        for object_key in object_keys:
+            task_id = tm._generate_unique_task_id(used_ids)
+            data = {
+                "id": task_id,
+                "type": "single_file",
+                "object_key": object_key,
+                "target_dir": target_dir,
+                "bucket": "tfds-ht",
+                "created_by": created_by,
+                "created_at": int(__import__('time').time()),
+                "status": "pending",
+                "priority": getattr(args, 'priority', 0),
+                "total_size": 0,
+                "piece_size": 0,  # chosen by the daemon from object size and throughput
+                "progress": {"downloaded": 0, "total": 0, "percentage": 0},
+            }
+            if chunk_concurrency:
+                data["chunk_concurrency"] = chunk_concurrency
+            tasks.append(data)
+        if len(tasks) == 1:
+            tm.add_task(tasks[0]["id"], tasks[0])
+            print(json.dumps({"task_id": tasks[0]["id"], "status": "pending"}))
+        else:
+            # multi-select: one transaction for all tasks
+            elapsed = tm.add_tasks(tasks)
+            print(json.dumps({"task_ids": [t["id"] for t in tasks], "status": "pending",
+                              "insert_seconds": round(elapsed, 3)}))
         sys.exit(0)
     
     if args.cmd == "status":
@@ -235,6 +270,20 @@ def main():
             print(json.dumps(get_favorites()))
         sys.exit(0)
     
+    if args.cmd == "rate-limit":
+        from linux_server.status_db import get_rate_limits, set_rate_limits
+        global_mbps = getattr(args, 'global_mbps', None)
+        user = getattr(args, 'user', None)
+        mbps = getattr(args, 'mbps', None)
+        if (user is None) != (mbps is None):
+            print(json.dumps({"error": "--user and --mbps must be given together"}))
+            sys.exit(2)
+        if global_mbps is None and user is None:
+            print(json.dumps(get_rate_limits()))
+        else:
+            print(json.dumps(set_rate_limits(global_mbps, user, mbps)))
+        sys.exit(0)
+    
     if args.cmd == "browse-obs":
         from linux_server.obs_operator import ObsWrapper
         bucket = getattr(args, 'bucket', 'tfds-ht')
@@ -9,22 +9,65 @@ try:
 except Exception:
     ObsWrapper = None  # type: ignore
 
-from linux_server.status_db import add_task
+from linux_server.status_db import get_download_records
 from linux_server.task_manager import TaskManager  # type: ignore
 from linux_server.obs_operator import ObsWrapper  # type: ignore
 from linux_server.config import load_config  # type: ignore
 
-def batch_create_tasks(bucket: str, obs_prefix: str, target_dir: str, created_by: str, after_ts=None) -> List[str]:
-    """List OBS objects under prefix and create a separate task per object after after_ts.
-    Returns a list of created task IDs.
+SMALL_OBJECT_THRESHOLD = 4 * 1024 * 1024  # objects below this size go to the small-object fast lane
+SMALL_BATCH_MAX_FILES = 1000  # objects per small_batch task
+
+def is_identical(obj: dict, local_path: str, bucket: str, records: dict) -> bool:
+    """Whether local_path already holds this OBS object.
+    With a download record for the path (written by the daemon), the record must name the same
+    object and ETag and the file must be unchanged since (same size and mtime). Without one,
+    fall back to size plus mtime: same size and not older than the object's last_modified.
+    """
+    try:
+        st = os.stat(local_path)
+    except OSError:
+        return False
+    size = obj.get("size")
+    if size is None or st.st_size != int(size):
+        return False
+    record = records.get(local_path)
+    if record is not None:
+        if record.get("bucket") != bucket or record.get("object_key") != obj.get("key"):
+            return False
+        if record.get("size") != st.st_size or record.get("mtime") != int(st.st_mtime):
+            return False
+        etag = obj.get("etag")
+        return not etag or not record.get("etag") or record.get("etag") == etag
+    return int(st.st_mtime) >= int(obj.get("last_modified") or 0)
+
+def batch_create_tasks(bucket: str, obs_prefix: str, target_dir: str, created_by: str, after_ts=None,
+                       chunk_concurrency=None, small_threshold=SMALL_OBJECT_THRESHOLD,
+                       skip_identical=True, report=None, priority=0) -> List[str]:
+    """List OBS objects under prefix and create tasks for objects modified after after_ts.
+    With skip_identical, objects whose local copy in target_dir is identical (see is_identical)
+    are skipped. If report is a dict it is filled with scheduled/skipped counts and bytes and
+    insert_seconds (time spent writing the tasks).
+    Objects smaller than small_threshold are grouped into small_batch tasks (one GET per
+    object, tracked as a single task); larger objects get a separate task each.
+    small_threshold=0 disables grouping.
+    chunk_concurrency, if given, overrides the daemon's per-object range request count.
+    priority is stored on every task (higher is dispatched first, see cli.py --priority).
+    All tasks are inserted in one transaction. Returns a list of created task IDs.
     """
     task_ids = []
+    if report is None:
+        report = {}
+    report.update({"scheduled": 0, "scheduled_bytes": 0, "skipped": 0, "skipped_bytes": 0})
     if ObsWrapper is None:
         return task_ids
     obs = ObsWrapper()
     objs = obs.list_objects(bucket, obs_prefix)
+    records = get_download_records() if skip_identical else {}
     tm = TaskManager()
     import time
+    small = []
+    tasks = []
+    used_ids = set()
     for obj in objs:
         last_mod = obj.get("last_modified")
         if last_mod is None:
@@ -41,7 +84,20 @@ def batch_create_tasks(bucket: str, obs_prefix: str, target_dir: str, created_by
             last_mod = 0
         if after_ts is not None and last_mod <= int(after_ts):
             continue
-        task_id = tm._generate_task_id()
+        size = obj.get("size")
+        if skip_identical and not obj.get("is_folder"):
+            local_path = os.path.join(target_dir, os.path.basename(obj.get("key") or ""))
+            if is_identical(dict(obj, last_modified=last_mod), local_path, bucket, records):
+                report["skipped"] += 1
+                report["skipped_bytes"] += int(size or 0)
+                continue
+        report["scheduled"] += 1
+        report["scheduled_bytes"] += int(size or 0)
+        if (small_threshold and size is not None and not obj.get("is_folder")
+                and int(size) < int(small_threshold)):
+            small.append({"key": obj.get("key"), "size": int(size), "etag": obj.get("etag")})
+            continue
+        task_id = tm._generate_unique_task_id(used_ids)
         data = {
             "id": task_id,
             "type": "single_file",
@@ -51,10 +107,34 @@ def batch_create_tasks(bucket: str, obs_prefix: str, target_dir: str, created_by
             "created_by": created_by,
             "created_at": int(time.time()),
             "status": "pending",
+            "priority": int(priority),
             "total_size": int(obj.get("size", 0)),
-            "piece_size": 4 * 1024 * 1024,
+            "piece_size": 0,  # chosen by the daemon from object size and throughput
             "progress": {"downloaded": 0, "total": int(obj.get("size", 0)), "percentage": 0},
         }
-        tm.add_task(task_id, data)
-        task_ids.append(task_id)
+        if chunk_concurrency:
+            data["chunk_concurrency"] = int(chunk_concurrency)
+        tasks.append(data)
+    for i in range(0, len(small), SMALL_BATCH_MAX_FILES):
+        batch = small[i:i + SMALL_BATCH_MAX_FILES]
+        total = sum(o["size"] for o in batch)
+        task_id = tm._generate_unique_task_id(used_ids)
+        data = {
+            "id": task_id,
+            "type": "small_batch",
+            "object_key": obs_prefix.rstrip("/"),  # display name; the files are in "objects"
+            "objects": batch,
+            "target_dir": target_dir,
+            "bucket": bucket,
+            "created_by": created_by,
+            "created_at": int(time.time()),
+            "status": "pending",
+            "priority": int(priority),
+            "total_size": total,
+            "progress": {"downloaded": 0, "total": total, "percentage": 0,
+                         "files_done": 0, "files_total": len(batch)},
+        }
+        tasks.append(data)
+    report["insert_seconds"] = round(tm.add_tasks(tasks), 3) if tasks else 0.0
+    task_ids.extend(task["id"] for task in tasks)
     return task_ids
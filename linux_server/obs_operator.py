@@ -7,16 +7,22 @@ from collections import defaultdict
 
 from obs import ObsClient
 
+from linux_server.obs_pool import MAX_CONNECTIONS, ObsClientPool
+
+# Every ObsWrapper in a process (listing, sync, downloads) reuses one keep-alive client
+# per endpoint/credentials from the same pool implementation the daemon uses. No log
+# callback: the Windows launcher treats any stderr output of cli.py as a failure.
+_CLIENT_POOL = ObsClientPool(MAX_CONNECTIONS)
 
 
 class ObsWrapper:
     def __init__(self, access_key_id=None, secret_access_key=None, server=None,
                  proxy_host=None, proxy_port=None, proxy_username=None, proxy_password=None):
 
-        self.client = ObsClient(
-            access_key_id='HPUAZFDHXXLVJG1IDV9B',
-            secret_access_key='1MdmEyU9yF5boNP2gOGy4W91PXyvvwHGHnOWX3OS',
-            server='obs.cn-north-4.myhuaweicloud.com',
+        self.client = _CLIENT_POOL.get(
+            'HPUAZFDHXXLVJG1IDV9B',
+            '1MdmEyU9yF5boNP2gOGy4W91PXyvvwHGHnOWX3OS',
+            'obs.cn-north-4.myhuaweicloud.com',
         )
 
     def is_available(self) -> bool:
@@ -59,10 +65,10 @@ class ObsWrapper:
         """
         if self.client is None:
             try:
-                self.client = ObsClient(
-                    access_key_id='HPUAZFDHXXLVJG1IDV9B',
-                    secret_access_key='1MdmEyU9yF5boNP2gOGy4W91PXyvvwHGHnOWX3OS',
-                    server='obs.cn-north-4.myhuaweicloud.com',
+                self.client = _CLIENT_POOL.get(
+                    'HPUAZFDHXXLVJG1IDV9B',
+                    '1MdmEyU9yF5boNP2gOGy4W91PXyvvwHGHnOWX3OS',
+                    'obs.cn-north-4.myhuaweicloud.com',
                 )
             except Exception:
                 pass
@@ -81,6 +87,9 @@ class ObsWrapper:
             for obj in contents:
                 key = getattr(obj, 'key', None) or getattr(obj, 'name', None)
                 size = getattr(obj, 'size', None)
+                etag = getattr(obj, 'etag', None)
+                if etag:
+                    etag = str(etag).strip('"')
 
                 # 提取 last_modified
                 lm = None
@@ -124,6 +133,7 @@ class ObsWrapper:
                             "key": key,
                             "size": size,
                             "last_modified": lm,
+                            "etag": etag,
                             "is_folder": is_folder
                         })
                     # else: 子目录中的文件，不返回
@@ -142,6 +152,7 @@ class ObsWrapper:
                         "key": key,
                         "size": size,
                         "last_modified": lm,
+                        "etag": etag,
                         "depth": depth,
                         "parent_dir": parent_dir,
                         "is_in_folder": depth > 0
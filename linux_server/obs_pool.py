@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Process-wide pool of shared ObsClient instances, used by the daemon and ObsWrapper.
+
+ObsClient is thread-safe and keeps keep-alive connections when long_conn_mode is on, so
+every task and listing in a process reuses one client per (endpoint, credentials).
+"""
+import hashlib
+import threading
+from typing import Callable, Dict, Optional
+
+MAX_CONNECTIONS = 32  # connections per shared ObsClient
+
+
+class ObsClientPool:
+    """One long-lived ObsClient per (server, AK, SK digest)."""
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS,
+                 log: Optional[Callable[[str], None]] = None):
+        self.max_connections = max(1, int(max_connections))
+        self.log = log
+        self._lock = threading.Lock()
+        self._clients = {}  # (server, ak, sk digest) -> ObsClient
+        self._hits = 0
+        self._misses = 0
+        self._limit_ignored = False  # the installed SDK rejected max_connections
+
+    def _log(self, message: str):
+        if self.log is not None:
+            self.log(message)
+
+    def _create_client(self, ak: str, sk: str, server: str):
+        from obs import ObsClient
+        kwargs = {
+            'access_key_id': ak,
+            'secret_access_key': sk,
+            'server': server,
+            'long_conn_mode': True
+        }
+        try:
+            return ObsClient(max_connections=self.max_connections, **kwargs)
+        except TypeError:
+            # Older SDKs do not accept max_connections
+            self._limit_ignored = True
+            self._log(f"ObsClient does not accept max_connections; {server} uses the SDK's "
+                      f"default connection limit instead of {self.max_connections}")
+            return ObsClient(**kwargs)
+
+    def get(self, ak: str, sk: str, server: str):
+        """Return the shared client for this endpoint and credentials, creating it once."""
+        key = (server, ak, hashlib.sha256((sk or '').encode('utf-8')).hexdigest())
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._hits += 1
+                return client
+            self._misses += 1
+            client = self._create_client(ak, sk, server)
+            self._clients[key] = client
+            self._log(f"Created shared OBS client for {server} ({len(self._clients)} in pool)")
+            return client
+
+    def stats(self) -> Dict:
+        """Pool size and hit/miss counts."""
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'hits': self._hits,
+                'misses': self._misses,
+                'max_connections': self.max_connections,
+                'limit_ignored': self._limit_ignored
+            }
+
+    def close_all(self):
+        """Close every client."""
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            self._clients.clear()
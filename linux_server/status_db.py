@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
-"""Thread-safe JSON storage for tasks/history/favorites."""
+"""Thread-safe storage for tasks/history/favorites.
+
+Tasks, history and download records live in a SQLite database in WAL mode (shared with
+the daemon); favorites and rate limits are small JSON files.
+"""
 import json
 import os
+import sqlite3
 import time
 import fcntl
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
+
+from linux_server.task_db import UPSERT_TASK, connect, insert_history, migrate_json, task_row, transaction
 
 DB_ROOT = "/data9/obs_tool/storage"
-TASKS_FILE = os.path.join(DB_ROOT, "tasks_db.json")
-HISTORY_FILE = os.path.join(DB_ROOT, "history.json")
+DB_FILE = os.path.join(DB_ROOT, "tasks.db")
 FAVORITES_FILE = os.path.join(DB_ROOT, "favorites.json")
 LOCK_FILE = os.path.join(DB_ROOT, ".db.lock")
+RATE_LIMITS_FILE = os.path.join(DB_ROOT, "rate_limits.json")
+
+_conn = None
 
 def _acquire_lock() -> object:
     lock_fd = open(LOCK_FILE, "w")
@@ -37,41 +46,79 @@ def _save_json(path: str, data: Any) -> None:
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
-def get_tasks() -> Dict[str, Any]:
-    return _load_json(TASKS_FILE, {})
+def _transaction():
+    """Write transaction on the shared connection."""
+    return transaction(_db())
+
+def _db() -> sqlite3.Connection:
+    """Open the task database once per process, creating it and importing legacy JSON files."""
+    global _conn
+    if _conn is None:
+        _conn = connect(DB_FILE)
+        migrate_json(_conn, os.path.dirname(DB_FILE))
+    return _conn
+
+def get_tasks(status: Optional[str] = None) -> Dict[str, Any]:
+    """All tasks (or only those with the given status), oldest first."""
+    if status is None:
+        rows = _db().execute("SELECT id, data FROM tasks ORDER BY created_at")
+    else:
+        rows = _db().execute("SELECT id, data FROM tasks WHERE status = ? ORDER BY created_at",
+                             (status,))
+    return {task_id: json.loads(data) for task_id, data in rows}
+
+def count_by_user() -> Dict[str, Dict[str, int]]:
+    """Task counts per created_by and status, e.g. {"alice": {"pending": 3, "running": 1}}."""
+    users: Dict[str, Dict[str, int]] = {}
+    rows = _db().execute("SELECT created_by, status, COUNT(*) FROM tasks GROUP BY created_by, status")
+    for user, status, count in rows:
+        users.setdefault(user or "unknown", {})[status] = count
+    return users
+
+def get_task(task_id: str) -> Optional[Dict[str, Any]]:
+    row = _db().execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _queued(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Stamp when a task entered the pending queue; the daemon reports queue-to-start latency from it."""
+    if task.get("status") == "pending" and not task.get("queued_at"):
+        task["queued_at"] = time.time()
+    return task
 
 def update_task(task_id: str, updates: Dict[str, Any]) -> None:
-    lock_fd = _acquire_lock()
-    try:
-        tasks = get_tasks()
-        if task_id not in tasks:
+    with _transaction() as conn:
+        row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None:
             raise KeyError(f"Task {task_id} not found")
-        tasks[task_id].update(updates)
-        _save_json(TASKS_FILE, tasks)
-    finally:
-        _release_lock(lock_fd)
+        task = json.loads(row[0])
+        if updates.get("status") == "pending" and task.get("status") != "pending":
+            task.pop("queued_at", None)
+        task.update(updates)
+        _queued(task)
+        task["updated_at"] = int(time.time())
+        conn.execute(UPSERT_TASK, task_row(task_id, task))
 
 def add_task(task_id: str, data: Dict[str, Any]) -> None:
-    lock_fd = _acquire_lock()
-    try:
-        tasks = get_tasks()
-        tasks[task_id] = data
-        _save_json(TASKS_FILE, tasks)
-    finally:
-        _release_lock(lock_fd)
+    with _transaction() as conn:
+        conn.execute(UPSERT_TASK, task_row(task_id, _queued(data)))
+
+def add_tasks(tasks: List[Dict[str, Any]]) -> int:
+    """Insert many tasks (each with an "id") in one transaction; returns the number inserted."""
+    with _transaction() as conn:
+        conn.executemany(UPSERT_TASK, [task_row(task["id"], _queued(task)) for task in tasks])
+    return len(tasks)
 
 def add_history(entry: Dict[str, Any]) -> None:
-    lock_fd = _acquire_lock()
-    try:
-        history = _load_json(HISTORY_FILE, [])
-        history.append(entry)
-        _save_json(HISTORY_FILE, history)
-    finally:
-        _release_lock(lock_fd)
+    with _transaction() as conn:
+        insert_history(conn, entry)
 
 def get_history(limit: int = 100) -> list:
-    history = _load_json(HISTORY_FILE, [])
-    return history[-limit:][::-1]
+    rows = _db().execute("SELECT data FROM history ORDER BY seq DESC LIMIT ?", (limit,))
+    return [json.loads(data) for (data,) in rows]
+
+def get_download_records() -> Dict[str, Any]:
+    """Files the daemon has downloaded, keyed by local path (bucket, object_key, size, etag, mtime)."""
+    return {path: json.loads(data) for path, data in _db().execute("SELECT path, data FROM downloads")}
 
 def get_favorites() -> list:
     return _load_json(FAVORITES_FILE, [])
@@ -80,3 +127,20 @@ def add_favorite(name: str, path: str) -> None:
     favorites = get_favorites()
     favorites.append({"name": name, "path": path})
     _save_json(FAVORITES_FILE, favorites)
+
+def get_rate_limits() -> Dict[str, Any]:
+    return _load_json(RATE_LIMITS_FILE, {})
+
+def set_rate_limits(global_mbps=None, user=None, user_mbps=None) -> Dict[str, Any]:
+    """Update runtime bandwidth limits (MB/s, 0 = unlimited); the daemon reloads on change."""
+    lock_fd = _acquire_lock()
+    try:
+        limits = get_rate_limits()
+        if global_mbps is not None:
+            limits["bandwidthLimitMBps"] = global_mbps
+        if user is not None and user_mbps is not None:
+            limits.setdefault("userBandwidthLimitMBps", {})[user] = user_mbps
+        _save_json(RATE_LIMITS_FILE, limits)
+        return limits
+    finally:
+        _release_lock(lock_fd)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""SQLite task database layout shared by the daemon and status_db.
+
+Both processes open the same tasks.db (WAL mode); the schema, row format, history
+retention and the one-time import of the legacy JSON files live here so they cannot drift.
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+BUSY_TIMEOUT = 30.0  # seconds to wait for another process's write transaction
+HISTORY_LIMIT = 100  # only the most recent history entries are kept
+SHARED_MODE = 0o666  # the storage dir is shared by all CLI users and the daemon
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    status TEXT,
+    created_at REAL,
+    created_by TEXT,
+    updated_at INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks (created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_created_by ON tasks (created_by);
+CREATE TABLE IF NOT EXISTS history (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    completed_at INTEGER,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS downloads (
+    path TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT_TASK = ("INSERT OR REPLACE INTO tasks (id, status, created_at, created_by, updated_at, data) "
+               "VALUES (?, ?, ?, ?, ?, ?)")
+
+def task_row(task_id: str, task: Dict[str, Any]) -> tuple:
+    """A task dict as a tasks row: indexed columns plus the full JSON."""
+    return (task_id, task.get("status"), task.get("created_at", 0), task.get("created_by"),
+            task.get("updated_at"), json.dumps(task, ensure_ascii=False))
+
+def _share(path: str) -> None:
+    """Give a database file SHARED_MODE; only its owner can, so failures are ignored."""
+    try:
+        if os.stat(path).st_mode & 0o777 != SHARED_MODE:
+            os.chmod(path, SHARED_MODE)
+    except OSError:
+        pass
+
+def connect(db_file: str, **kwargs) -> sqlite3.Connection:
+    """Open (and create if needed) the task database in WAL mode.
+
+    SQLite creates the -wal and -shm files with the database file's permissions, so the
+    database file is made shared before SQLite opens it; -wal/-shm files left by a process
+    with a restrictive umask are fixed up afterwards.
+    """
+    if not os.path.exists(db_file):
+        os.close(os.open(db_file, os.O_RDWR | os.O_CREAT, SHARED_MODE))
+    _share(db_file)
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT, isolation_level=None, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    for suffix in ("-wal", "-shm"):
+        _share(db_file + suffix)
+    return conn
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """Write transaction; BEGIN IMMEDIATE takes the write lock up front."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def insert_history(conn: sqlite3.Connection, entry: Dict[str, Any]) -> None:
+    """Append a history entry and drop all but the newest HISTORY_LIMIT."""
+    conn.execute("INSERT INTO history (completed_at, data) VALUES (?, ?)",
+                 (entry.get("completed_at", int(time.time())), json.dumps(entry, ensure_ascii=False)))
+    conn.execute("DELETE FROM history WHERE seq <= (SELECT MAX(seq) FROM history) - ?",
+                 (HISTORY_LIMIT,))
+
+def _load_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return default
+
+def migrate_json(conn: sqlite3.Connection, storage_dir: str) -> Dict[str, Any]:
+    """Import tasks_db.json/history.json/downloads.json once, then rename them to *.migrated.
+
+    Returns {"tasks": imported task count, "files": renamed files, "errors": [(path, error)]};
+    "tasks" is None when the import had already been done.
+    """
+    legacy = [os.path.join(storage_dir, name)
+              for name in ("tasks_db.json", "history.json", "downloads.json")]
+    tasks_file, history_file, downloads_file = legacy
+    with transaction(conn):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return {"tasks": None, "files": [], "errors": []}
+        tasks = _load_json(tasks_file, {})
+        for task_id, task in tasks.items():
+            conn.execute(UPSERT_TASK, task_row(task_id, task))
+        for entry in _load_json(history_file, [])[-HISTORY_LIMIT:]:
+            conn.execute("INSERT INTO history (completed_at, data) VALUES (?, ?)",
+                         (entry.get("completed_at", 0), json.dumps(entry, ensure_ascii=False)))
+        for path, entry in _load_json(downloads_file, {}).items():
+            conn.execute("INSERT OR REPLACE INTO downloads (path, data) VALUES (?, ?)",
+                         (path, json.dumps(entry, ensure_ascii=False)))
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                     (str(int(time.time())),))
+    files: List[str] = []
+    errors = []
+    for path in legacy:
+        if not os.path.exists(path):
+            continue
+        try:
+            os.rename(path, path + ".migrated")
+            files.append(path)
+        except OSError as e:
+            errors.append((path, e))
+    return {"tasks": len(tasks), "files": files, "errors": errors}
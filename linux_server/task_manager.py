@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """Task management for Linux OBS downloader daemon (simplified)."""
 import time
-from linux_server.status_db import add_task, get_tasks, update_task
+from linux_server.status_db import add_task, add_tasks, count_by_user, get_task, get_tasks, update_task
 
 class TaskManager:
     def __init__(self):
@@ -15,13 +15,35 @@ class TaskManager:
         """添加任务到数据库"""
         add_task(task_id, data)  # type: ignore
 
+    def add_tasks(self, tasks: list) -> float:
+        """批量添加任务（一个事务），返回写入耗时（秒）"""
+        start = time.time()
+        add_tasks(tasks)
+        return time.time() - start
+
+    def _generate_unique_task_id(self, used: set) -> str:
+        """生成不在used中的任务ID并加入used（同一秒内批量创建时随机后缀可能重复）"""
+        task_id = self._generate_task_id()
+        candidate, n = task_id, 1
+        while candidate in used:
+            candidate = f"{task_id}_{n}"
+            n += 1
+        used.add(candidate)
+        return candidate
+
     def get_status(self, task_id: str):
-        tasks = get_tasks()
-        return tasks.get(task_id)
+        return get_task(task_id)
 
     def list_tasks(self):
         return get_tasks()
 
+    def queue_depth_by_user(self) -> dict:
+        """每个用户（created_by）的排队任务数和运行中任务数"""
+        return {user: {"pending": counts.get("pending", 0), "running": counts.get("running", 0),
+                       "paused": counts.get("paused", 0)}
+                for user, counts in count_by_user().items()
+                if counts.get("pending") or counts.get("running") or counts.get("paused")}
+
     def pause_task(self, task_id: str):
         update_task(task_id, {"status": "paused"})
 
@@ -8,11 +8,16 @@ heartbeat progress, and final file assembly.
 Design goals:
 - Download a target object in 4MB chunks (configurable) from Huawei OBS.
 - Each chunk is saved as <objectKey basename>.part{index} in a local directory.
-- Support resuming: if a chunk file already exists, reuse it and skip re-download.
+- Support resuming: completed chunks are recorded in a compact manifest
+  (<basename>.manifest.json: bitmap, piece size, total size, ETag), so resume
+  and progress reporting never probe the chunk files one by one.
 - Robust retry with exponential backoff and jitter on transient errors.
+- The object MD5 is computed while chunks stream to disk and compared against
+  the ETag / Content-MD5 / x-obs-meta-md5 when OBS provides one.
 - Periodic heartbeat / progress output to keep users informed.
 - After all chunks are downloaded, merge them in order into the final file
-  named after the object basename, and clean up the temporary chunk files.
+  named after the object basename (kernel-side copy, bounded memory), and
+  clean up the temporary chunk files.
 - Configuration lives in a root-level config.json for easy reuse; the script
   optionally accepts an OBS_DL_CONFIG env var to override the path.
 
@@ -27,6 +32,8 @@ Notes:
 import os
 import sys
 import json
+import base64
+import hashlib
 import math
 import time
 import threading
@@ -42,6 +49,9 @@ except Exception:  # pragma: no cover
 
 
 CONFIG_FILE_DEFAULT = "./config.json"
+MERGE_BUFFER_SIZE = 1024 * 1024  # fallback buffer when kernel-side copy is unavailable
+STREAM_BLOCK_SIZE = 1024 * 1024  # block size for streaming range bodies to disk
+MANIFEST_SAVE_INTERVAL = 1.0  # minimum seconds between manifest writes
 
 
 def load_config(path: str) -> dict:
@@ -56,25 +66,104 @@ def ensure_dir(path: str) -> None:
         os.makedirs(path, exist_ok=True)
 
 
+class ResumeManifest:
+    """Compact record of completed chunks: bitmap plus piece size, total size and ETag.
+
+    Written atomically (temp file + rename); a manifest whose parameters or ETag
+    do not match the current object is ignored.
+    """
+
+    def __init__(self, path: str, piece_size: int, total_size: int, etag=None):
+        self.path = path
+        self.piece_size = piece_size
+        self.total_size = total_size
+        self.etag = etag
+        self.pieces = (total_size + piece_size - 1) // piece_size
+        self.bits = bytearray((self.pieces + 7) // 8)
+        self.done_bytes = 0
+        self.dirty = False
+        self._saved_at = 0.0
+
+    def load(self) -> bool:
+        """Load the manifest; returns False if it is missing or stale."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("piece_size") != self.piece_size or data.get("total_size") != self.total_size:
+                return False
+            if self.etag and data.get("etag") and data.get("etag") != self.etag:
+                return False
+            bits = bytearray(base64.b64decode(data.get("bitmap", "")))
+            if len(bits) != len(self.bits):
+                return False
+        except Exception:
+            return False
+        self.bits = bits
+        self.done_bytes = sum(self.piece_bytes(i) for i in range(1, self.pieces + 1) if self.is_done(i))
+        return True
+
+    def save(self):
+        temp_file = self.path + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "piece_size": self.piece_size,
+                "total_size": self.total_size,
+                "etag": self.etag,
+                "bitmap": base64.b64encode(bytes(self.bits)).decode("ascii"),
+            }, f)
+        os.replace(temp_file, self.path)
+        self.dirty = False
+        self._saved_at = time.time()
+
+    def save_if_due(self):
+        if self.dirty and time.time() - self._saved_at >= MANIFEST_SAVE_INTERVAL:
+            self.save()
+
+    def piece_bytes(self, index: int) -> int:
+        return min(self.piece_size, self.total_size - (index - 1) * self.piece_size)
+
+    def is_done(self, index: int) -> bool:
+        i = index - 1
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def mark_done(self, index: int):
+        if not self.is_done(index):
+            i = index - 1
+            self.bits[i >> 3] |= (1 << (i & 7))
+            self.done_bytes += self.piece_bytes(index)
+            self.dirty = True
+
+    def remove(self):
+        self.dirty = False
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
 class Heartbeat(threading.Thread):
     """Background thread that periodically prints download progress."""
 
-    def __init__(self, total_size: int, local_dir: str, base_name: str, piece_size: int, interval_sec: float = 30.0):
+    def __init__(self, total_size: int, local_dir: str, base_name: str, piece_size: int, interval_sec: float = 30.0,
+                 manifest: ResumeManifest = None):
         super().__init__(daemon=True)
         self.total_size = total_size
         self.local_dir = local_dir
         self.base_name = base_name
         self.piece_size = piece_size
+        self.manifest = manifest
         self.interval = max(1.0, float(interval_sec))
-        self._stop = threading.Event()
+        self._stop_event = threading.Event()
         self._start_time = time.time()
 
     def stop(self):
-        self._stop.set()
+        self._stop_event.set()
         self.join()
 
     def get_downloaded_bytes(self) -> int:
-        """Compute total downloaded bytes by summing existing chunk files."""
+        """Downloaded bytes from the manifest (no file access), or by summing chunk files without one."""
+        if self.manifest is not None:
+            return self.manifest.done_bytes
         total_parts = (self.total_size + self.piece_size - 1) // self.piece_size
         downloaded = 0
         for idx in range(1, int(total_parts) + 1):
@@ -84,7 +173,7 @@ class Heartbeat(threading.Thread):
         return downloaded
 
     def run(self):
-        while not self._stop.is_set():
+        while not self._stop_event.is_set():
             downloaded = self.get_downloaded_bytes()
             elapsed = time.time() - self._start_time
             speed = downloaded / elapsed if elapsed > 0 else 0
@@ -92,7 +181,55 @@ class Heartbeat(threading.Thread):
             eta = (remaining / speed) if speed > 0 else None
             eta_str = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "Unknown"
             print(f"[Heartbeat] {downloaded}/{self.total_size} bytes | speed {speed:.2f} B/s | ETA {eta_str}")
-            time.sleep(self.interval)
+            self._stop_event.wait(self.interval)
+
+
+def _hex_digest(value, size):
+    """Normalize a hex or base64 digest to lowercase hex; None if it is not one."""
+    if not value:
+        return None
+    value = str(value).strip().strip('"')
+    if len(value) == size * 2 and all(c in "0123456789abcdefABCDEF" for c in value):
+        return value.lower()
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except Exception:
+        return None
+    return raw.hex() if len(raw) == size else None
+
+
+def get_object_meta(obs_client, bucket, key):
+    """Return (etag, expected_md5) via HEAD; either may be None.
+
+    expected_md5 comes from x-obs-meta-md5 or Content-MD5, else from the ETag of a
+    single-part, unencrypted upload (multipart and SSE ETags are not content MD5s).
+    """
+    try:
+        resp = obs_client.headObject(bucket, key)  # type: ignore[attr-defined]
+    except Exception:
+        return None, None
+    headers = {}
+    for name, value in getattr(resp, "header", None) or []:
+        headers[str(name).lower()] = value
+    if hasattr(resp, "headers") and resp.headers:
+        headers.update((str(k).lower(), v) for k, v in resp.headers.items())
+    etag = getattr(getattr(resp, "body", None), "etag", None) or headers.get("etag")
+    etag = etag.strip('"') if etag else None
+    expected = _hex_digest(headers.get("x-obs-meta-md5"), 16) or _hex_digest(headers.get("content-md5"), 16)
+    if not expected and etag and not any(k.startswith("x-obs-server-side-encryption") for k in headers):
+        expected = _hex_digest(etag, 16) if len(etag) == 32 else None
+    return etag, expected
+
+
+def hash_file(path, digest, buffer):
+    """Feed a file into digest through a reusable buffer."""
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            digest.update(view[:n])
 
 
 def get_total_size(obs_client, bucket, key):
@@ -127,19 +264,143 @@ def get_total_size(obs_client, bucket, key):
     return None
 
 
-def download_range(obs_client, bucket, key, start, end, part_path):
-    """Download a single byte range [start, end] and write to part_path. Returns bytes written."""
+def copy_file_data(fd_in, fd_out, count, buffer=None):
+    """Copy count bytes from fd_in to fd_out at their current offsets. Returns bytes copied.
+
+    Uses kernel-side copying (copy_file_range, then sendfile) so the data never
+    passes through Python; falls back to a single reusable buffer otherwise.
+    """
+    copied = 0
+    # Both kernel copies advance the file offsets, so a fallback resumes in place.
+    for kernel_copy in ("copy_file_range", "sendfile"):
+        if copied >= count or not hasattr(os, kernel_copy):
+            continue
+        try:
+            while copied < count:
+                if kernel_copy == "copy_file_range":
+                    n = os.copy_file_range(fd_in, fd_out, count - copied)
+                else:
+                    n = os.sendfile(fd_out, fd_in, None, count - copied)
+                if n == 0:
+                    return copied
+                copied += n
+        except OSError:
+            continue
+
+    if copied < count:
+        if buffer is None:
+            buffer = bytearray(MERGE_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while copied < count:
+            n = os.readv(fd_in, [view[:min(len(view), count - copied)]])
+            if n == 0:
+                break
+            chunk = view[:n]
+            while chunk:
+                written = os.write(fd_out, chunk)
+                chunk = chunk[written:]
+            copied += n
+    return copied
+
+
+def merge_parts(part_paths, final_path):
+    """Concatenate part files into final_path with bounded memory. Returns bytes merged."""
+    merged = 0
+    buffer = bytearray(MERGE_BUFFER_SIZE)
+    fd_out = os.open(final_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        for p in part_paths:
+            fd_in = os.open(p, os.O_RDONLY)
+            try:
+                size = os.fstat(fd_in).st_size
+                copied = copy_file_data(fd_in, fd_out, size, buffer)
+            finally:
+                os.close(fd_in)
+            if copied != size:
+                raise RuntimeError(f"Short copy while merging {p}: {copied} != {size}")
+            merged += copied
+    finally:
+        os.close(fd_out)
+    return merged
+
+
+def remove_parts(part_paths):
+    """Delete chunk files, ignoring ones that are already gone."""
+    for p in part_paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def download_range(obs_client, bucket, key, start, end, part_path, buffer=None, digest=None):
+    """Download a single byte range [start, end] and write to part_path. Returns bytes written.
+
+    The response body is streamed to disk in blocks through a reusable buffer, so
+    memory use does not grow with the piece size. digest, if given, is updated with
+    every block written.
+    """
     headers = GetObjectHeader()
     if hasattr(headers, 'range'):
         headers.range = f"{start}-{end}"
-    resp = obs_client.getObject(bucket, key, loadStreamInMemory=True, headers=headers)  # type: ignore[arg-type]
-    if getattr(resp, "status", 500) >= 300:
-        msg = getattr(resp, "errorMessage", "") or "Unknown error"
-        raise RuntimeError(f"HTTP {resp.status} error for range {start}-{end}: {msg}")
-    data = resp.body.buffer if hasattr(resp, "body") and resp.body and hasattr(resp.body, "buffer") else b""
-    with open(part_path, "wb") as f:
-        f.write(data)
-    return len(data)
+    resp = obs_client.getObject(bucket, key, loadStreamInMemory=False, headers=headers)  # type: ignore[arg-type]
+    body = getattr(resp, "body", None)
+    stream = getattr(body, "response", None) if body is not None else None
+    try:
+        if getattr(resp, "status", 500) >= 300:
+            msg = getattr(resp, "errorMessage", "") or "Unknown error"
+            raise RuntimeError(f"HTTP {resp.status} error for range {start}-{end}: {msg}")
+        if buffer is None:
+            buffer = bytearray(STREAM_BLOCK_SIZE)
+        view = memoryview(buffer)
+        written = 0
+        with open(part_path, "wb") as f:
+            data = getattr(body, "buffer", None) if body is not None else None
+            if data:
+                f.write(data)
+                if digest is not None:
+                    digest.update(data)
+                return len(data)
+            if stream is None:
+                return 0
+            while True:
+                if hasattr(stream, "readinto"):
+                    n = stream.readinto(view)
+                else:
+                    chunk = stream.read(len(view))
+                    n = len(chunk)
+                    view[:n] = chunk
+                if not n:
+                    break
+                f.write(view[:n])
+                if digest is not None:
+                    digest.update(view[:n])
+                written += n
+        return written
+    finally:
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+def probe_parts(part_paths, piece_size, total_size):
+    """Legacy resume without a manifest: return the first index whose chunk file is missing or incomplete."""
+    for idx, p in enumerate(part_paths, start=1):
+        if os.path.exists(p):
+            actual = os.path.getsize(p)
+            expected = min(piece_size, total_size - (idx - 1) * piece_size)
+            if actual != expected:
+                # 分片损坏/不完整，删除后从该分片重新下载
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+                return idx
+        else:
+            return idx
+    return len(part_paths) + 1  # 所有分片已完整存在
 
 
 def main():
@@ -163,6 +424,7 @@ def main():
     maxRetries = int(cfg.get("maxRetries", 6))
     backoffBase = float(cfg.get("backoffBaseSec", 2.0))
     heartbeatInterval = float(cfg.get("heartbeatIntervalSec", 30.0))
+    verifyChecksum = bool(cfg.get("verifyChecksum", True))
     server = cfg.get("server", "https://obs.cn-north-4.myhuaweicloud.com")
 
     proxy = cfg.get("proxy", {})
@@ -209,40 +471,40 @@ def main():
     total_parts = (total_size + pieceSize - 1) // pieceSize
     part_paths = [os.path.join(localDir, f"{base_name}.part{idx}") for idx in range(1, total_parts + 1)]
 
-    # 6) 断点续传：依据实际分片文件大小来判断需要重新下载的分片
-    start_index = 1
-    all_exist = True
-    for idx, p in enumerate(part_paths, start=1):
-        if os.path.exists(p):
-            actual = os.path.getsize(p)
-            expected = min(pieceSize, total_size - (idx - 1) * pieceSize)
-            if actual != expected:
-                # 分片损坏/不完整，删除后从该分片重新下载
-                try:
-                    os.remove(p)
-                except OSError:
-                    pass
-                start_index = idx
-                all_exist = False
-                break
+    # 6) 断点续传：优先读取续传清单（单个文件，无需逐个探测分片）；
+    #    没有清单时依据实际分片文件大小判断，并据此生成清单
+    etag, expected_md5 = get_object_meta(obsClient, bucket, objectKey)
+    manifest = ResumeManifest(os.path.join(localDir, f"{base_name}.manifest.json"),
+                              pieceSize, total_size, etag)
+    if manifest.load():
+        start_index = next((idx for idx in range(1, total_parts + 1) if not manifest.is_done(idx)),
+                           total_parts + 1)
+    else:
+        if os.path.exists(manifest.path):
+            # 清单与当前对象不一致（对象被覆盖或分片大小变化），已有分片不可复用
+            print("Resume manifest does not match the object; downloading all parts again.")
+            start_index = 1
         else:
-            start_index = idx
-            all_exist = False
-            break
-    if all_exist:
-        start_index = total_parts + 1  # 所有分片已完整存在
+            start_index = probe_parts(part_paths, pieceSize, total_size)
+        for idx in range(1, start_index):
+            manifest.mark_done(idx)
+        manifest.save()
 
-    hb = Heartbeat(total_size, localDir, base_name, pieceSize, heartbeatInterval)
+    hb = Heartbeat(total_size, localDir, base_name, pieceSize, heartbeatInterval, manifest)
     hb.start()
 
     final_path = os.path.join(localDir, base_name)
 
+    stream_buffer = bytearray(int(cfg.get("streamBlockSize", STREAM_BLOCK_SIZE)))
+
     try:
-        downloaded_so_far = 0
-        for idx in range(1, start_index):
-            p = part_paths[idx - 1]
-            if os.path.exists(p):
-                downloaded_so_far += os.path.getsize(p)
+        downloaded_so_far = manifest.done_bytes
+
+        # 整对象MD5随分片按顺序写盘逐块计算；续传时先补算已有分片
+        object_md5 = hashlib.md5() if verifyChecksum else None
+        if object_md5 is not None:
+            for idx in range(1, start_index):
+                hash_file(part_paths[idx - 1], object_md5, stream_buffer)
 
         # 逐分片下载，带重试和退避
         for idx in range(start_index, total_parts + 1):
@@ -255,11 +517,17 @@ def main():
                 attempt += 1
                 try:
                     print(f"Downloading part {idx}/{total_parts} (range {start}-{end})")
-                    downloaded = download_range(obsClient, bucket, objectKey, start, end, part_path)
+                    # 每次尝试基于副本计算，失败重试不会混入不完整的数据
+                    attempt_md5 = object_md5.copy() if object_md5 is not None else None
+                    downloaded = download_range(obsClient, bucket, objectKey, start, end, part_path, stream_buffer,
+                                                attempt_md5)
                     expected = end - start + 1
                     if downloaded != expected:
                         raise RuntimeError(f"Downloaded {downloaded} bytes, expected {expected} bytes")
+                    object_md5 = attempt_md5
                     downloaded_so_far += downloaded
+                    manifest.mark_done(idx)
+                    manifest.save_if_due()
                     break
                 except Exception as e:
                     if attempt >= maxRetries:
@@ -271,18 +539,26 @@ def main():
                     print(f"Part {idx} failed: {e}. Retry {attempt}/{maxRetries} after {wait:.1f}s")
                     time.sleep(wait)
 
-        # 7) 合并分片为最终文件
-        with open(final_path, "wb") as fout:
-            for i in range(1, total_parts + 1):
-                p = os.path.join(localDir, f"{base_name}.part{i}")
-                with open(p, "rb") as fin:
-                    fout.write(fin.read())
+        # 7) 校验整对象MD5（不一致时不合并，并删除分片文件和续传清单，下次运行全部重新下载）
+        if object_md5 is not None:
+            md5 = object_md5.hexdigest()
+            if expected_md5 and md5 != expected_md5:
+                remove_parts(part_paths)
+                manifest.remove()
+                raise RuntimeError(f"MD5 mismatch: {md5} != {expected_md5}")
+            print(f"MD5: {md5}" + (" (matches OBS)" if expected_md5 else " (OBS provides no checksum)"))
+
+        # 8) 合并分片为最终文件（内核态拷贝，内存占用有上限）
+        merge_start = time.time()
+        merged = merge_parts(part_paths, final_path)
+        merge_elapsed = max(time.time() - merge_start, 1e-6)
+        print(f"Merged {merged} bytes in {merge_elapsed:.2f}s "
+              f"({merged / merge_elapsed / 1024 / 1024:.2f} MB/s)")
         print(f"Download completed. Final file: {final_path}")
 
-        # 8) 清理分片文件（可选）
-        for p in part_paths:
-            if os.path.exists(p):
-                os.remove(p)
+        # 9) 清理分片文件和续传清单（可选）
+        remove_parts(part_paths)
+        manifest.remove()
         print("Temporary parts cleaned up.")
 
     except KeyboardInterrupt:
@@ -291,6 +567,8 @@ def main():
         print("Download failed:", e)
         traceback.print_exc()
     finally:
+        if manifest.dirty:
+            manifest.save()
         hb.stop()
 
 
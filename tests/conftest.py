@@ -0,0 +1,261 @@
+"""Shared fixtures: an in-memory fake of the OBS SDK and a daemon rooted in a temp dir."""
+import hashlib
+import importlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linux_server import daemon, status_db  # noqa: E402
+
+
+class FakeResponse(dict):
+    """Mimics the SDK's GetResult: a dict with the body, plus status, headers and errorCode."""
+
+    def __init__(self, status, body=None, headers=None, error_code=None):
+        super().__init__(body=body)
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.errorCode = error_code
+        self.errorMessage = error_code or ''
+
+
+class FakeBody:
+    def __init__(self, data=None, stream=None, contents=None):
+        self.buffer = data
+        self.response = stream
+        self.contents = contents or []
+        self.commonPrefixs = []
+        self.is_truncated = False
+        self.next_marker = None
+
+
+class FakeObjectHeader:
+    range = None
+
+
+class FakeObs:
+    """In-memory OBS endpoint.
+
+    Objects are stored by key with a single-part (MD5) ETag unless one is given. Every GET is
+    logged as (key, start, end); ``hooks`` run before a GET is served and may sleep or raise to
+    inject latency and failures.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.etags = {}
+        self.headers = {}
+        self.gets = []
+        self.heads = 0
+        self.clients = []
+        self.hooks = []
+        self.inflight = 0
+        self.max_inflight = 0
+        self._lock = threading.Lock()
+
+    def put(self, key, data, etag=None, headers=None):
+        self.objects[key] = data
+        self.etags[key] = etag or hashlib.md5(data).hexdigest()
+        self.headers[key] = headers or {}
+        return data
+
+    def ranges(self, key=None):
+        return [(start, end) for k, start, end in self.gets if key is None or k == key]
+
+    def module(self):
+        server = self
+
+        class ObsClient:
+            def __init__(self, **kwargs):
+                self.kwargs = kwargs
+                server.clients.append(self)
+
+            def headObject(self, bucket, key):
+                with server._lock:
+                    server.heads += 1
+                if key not in server.objects:
+                    return FakeResponse(404, error_code='NoSuchKey')
+                headers = {'Content-Length': str(len(server.objects[key])),
+                           'ETag': f'"{server.etags[key]}"'}
+                headers.update(server.headers[key])
+                return FakeResponse(200, headers=headers)
+
+            def getObject(self, bucket, key, loadStreamInMemory=False, headers=None, **kwargs):
+                data = server.objects.get(key)
+                if data is None:
+                    return FakeResponse(404, error_code='NoSuchKey')
+                start, end = 0, len(data) - 1
+                if headers is not None and headers.range:
+                    start, end = (int(n) for n in headers.range.split('-'))
+                with server._lock:
+                    server.gets.append((key, start, end))
+                    server.inflight += 1
+                    server.max_inflight = max(server.max_inflight, server.inflight)
+                try:
+                    for hook in list(server.hooks):
+                        hook(key, start, end)
+                finally:
+                    with server._lock:
+                        server.inflight -= 1
+                piece = data[start:end + 1]
+                body = FakeBody(piece) if loadStreamInMemory else FakeBody(stream=io.BytesIO(piece))
+                return FakeResponse(206 if headers is not None and headers.range else 200, body=body,
+                                    headers={'Content-Range': f'bytes {start}-{end}/{len(data)}',
+                                             'ETag': f'"{server.etags[key]}"'})
+
+            def listObjects(self, bucket, prefix=None, marker=None, max_keys=None, **kwargs):
+                contents = [types.SimpleNamespace(key=key, size=len(data), etag=f'"{server.etags[key]}"',
+                                                  lastModified=None)
+                            for key, data in sorted(server.objects.items())
+                            if key.startswith(prefix or '')]
+                return FakeResponse(200, body=FakeBody(contents=contents))
+
+            def close(self):
+                pass
+
+        module = types.ModuleType('obs')
+        module.ObsClient = ObsClient
+        module.GetObjectHeader = FakeObjectHeader
+        return module
+
+
+@pytest.fixture(autouse=True)
+def daemon_log(tmp_path_factory, monkeypatch):
+    """Send the daemon's log file to a temp dir of its own."""
+    monkeypatch.setattr(daemon, 'LOG_FILE', str(tmp_path_factory.mktemp('log') / 'daemon.log'))
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, 'condition not reached'
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def wait_until():
+    """Poll a predicate until it holds (fails the test after the timeout)."""
+    return _wait_until
+
+
+@pytest.fixture
+def obs_server(monkeypatch):
+    """Install the fake SDK as the ``obs`` module."""
+    server = FakeObs()
+    monkeypatch.setitem(sys.modules, 'obs', server.module())
+    return server
+
+
+class DaemonEnv:
+    """Daemon paths redirected into a temp dir, plus helpers to run tasks synchronously."""
+
+    def __init__(self, root, monkeypatch):
+        self.root = str(root)
+        self.monkeypatch = monkeypatch
+        self.storage = os.path.join(self.root, 'storage')
+        self.out = os.path.join(self.root, 'out')
+        self.config = {'streamBlockSize': 64 * 1024}
+        self._opened = []
+        self._locks = []
+        self.write_config()
+
+    def write_config(self, **settings):
+        self.config.update(settings)
+        with open(daemon.CONFIG_PATH, 'w', encoding='utf-8') as f:
+            json.dump(self.config, f)
+
+    def executor(self, **kwargs):
+        """A DatabaseManager and TaskExecutor that are shut down after the test."""
+        db = daemon.DatabaseManager(self.storage)
+        kwargs.setdefault('stream_block_size', 64 * 1024)
+        kwargs.setdefault('max_buffer_memory', 4 * 1024 * 1024)
+        executor = daemon.TaskExecutor(db, **kwargs)
+        self._opened.append((db, executor))
+        return db, executor
+
+    def daemon(self):
+        """A DownloadDaemon on the temp storage dir (signal handlers left alone), shut down after the test."""
+        self.monkeypatch.setattr(daemon.signal, 'signal', lambda signum, handler: None)
+        instance = daemon.DownloadDaemon()
+        self._opened.append((instance.db, instance.executor))
+        self._locks.append(instance.daemon_lock)
+        return instance
+
+    def task(self, task_id, object_key, **fields):
+        task = {
+            'id': task_id,
+            'object_key': object_key,
+            'bucket': 'bucket',
+            'target_dir': self.out,
+            'status': 'pending',
+            'created_at': time.time(),
+            'created_by': 'tester',
+            'maxRetries': 2,
+            'backoffBaseSec': 0.01
+        }
+        task.update(fields)
+        return task
+
+    def run(self, db, executor, task):
+        """Add the task and execute it on the calling thread; return the stored task."""
+        if db.get_task(task['id']) is None:
+            db.add_task(task['id'], task)
+        executor._execute_task(task['id'], dict(db.get_task(task['id'])))
+        return db.get_task(task['id'])
+
+    def path(self, name):
+        return os.path.join(self.out, name)
+
+    def close(self):
+        for db, executor in self._opened:
+            executor.cleanup()
+            db.close()
+        for lock in self._locks:
+            lock.release()
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch, obs_server):
+    """Point every file the daemon touches at tmp_path."""
+    storage = tmp_path / 'storage'
+    storage.mkdir()
+    monkeypatch.setattr(daemon, 'CONFIG_PATH', str(tmp_path / 'config.json'))
+    monkeypatch.setattr(daemon, 'STORAGE_DIR', str(storage))
+    monkeypatch.setattr(daemon, 'LOCK_FILE', str(storage / '.daemon.lock'))
+    monkeypatch.setattr(daemon, 'DB_FILE', str(storage / 'tasks.db'))
+    monkeypatch.setattr(daemon, 'RATE_LIMITS_FILE', str(storage / 'rate_limits.json'))
+    state = DaemonEnv(tmp_path, monkeypatch)
+    yield state
+    state.close()
+
+
+@pytest.fixture
+def status_store(env, monkeypatch):
+    """Point the CLI-side task store (status_db) at the daemon's temp storage dir."""
+    monkeypatch.setattr(status_db, 'DB_ROOT', env.storage)
+    monkeypatch.setattr(status_db, 'DB_FILE', os.path.join(env.storage, 'tasks.db'))
+    monkeypatch.setattr(status_db, 'LOCK_FILE', os.path.join(env.storage, '.db.lock'))
+    monkeypatch.setattr(status_db, 'FAVORITES_FILE', os.path.join(env.storage, 'favorites.json'))
+    monkeypatch.setattr(status_db, 'RATE_LIMITS_FILE', os.path.join(env.storage, 'rate_limits.json'))
+    monkeypatch.setattr(status_db, '_conn', None)
+    yield status_db
+    if status_db._conn is not None:
+        status_db._conn.close()
+
+
+@pytest.fixture
+def folder_sync(status_store, obs_server, monkeypatch):
+    """linux_server.folder_sync listing through the fake SDK with a fresh client pool."""
+    from linux_server import obs_operator
+    from linux_server.obs_pool import ObsClientPool
+    monkeypatch.setattr(obs_operator, '_CLIENT_POOL', ObsClientPool())
+    return importlib.import_module('linux_server.folder_sync')
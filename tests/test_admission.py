@@ -0,0 +1,136 @@
+"""Per-mount writer limits and disk-space reservation before a task is dispatched."""
+import os
+import types
+
+import pytest
+
+from linux_server import daemon
+from linux_server.daemon import DiskSpaceError, MountAdmission
+
+KB = 1024
+MB = 1024 * KB
+
+
+class FakeDisk:
+    """statvfs for every path: `free` bytes available out of `size`."""
+
+    def __init__(self, free, size=100 * MB):
+        self.free = free
+        self.size = size
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return types.SimpleNamespace(f_bavail=self.free, f_frsize=1, f_blocks=self.size)
+
+
+@pytest.fixture
+def disk(monkeypatch):
+    disk = FakeDisk(10 * MB)
+    monkeypatch.setattr(daemon.os, 'statvfs', disk)
+    return disk
+
+
+@pytest.fixture
+def admission(env):
+    db, executor = env.executor()
+    admission = MountAdmission(db)
+    admission.configure(margin=0, write_mode='parts')
+    return admission
+
+
+def big(env, task_id, size=4 * MB, **fields):
+    return env.task(task_id, 'obj.bin', total_size=size, piece_size=1 * MB, **fields)
+
+
+def test_peak_usage_by_layout(env, admission):
+    assert admission.peak_usage(big(env, 't1')) == 5 * MB
+    assert admission.peak_usage(big(env, 't1', write_mode='direct')) == 4 * MB
+    assert admission.peak_usage(big(env, 't1', size=1 * MB)) == 1 * MB
+    assert admission.peak_usage(env.task('t1', 'obj.bin')) == 0
+    assert admission.peak_usage(env.task('b', 'data', type='small_batch', total_size=3 * MB,
+                                         progress={'downloaded': 1 * MB})) == 2 * MB
+
+
+def test_writer_limit_is_checked_before_any_io(env, admission, disk):
+    admission.configure({'default': {'maxWriters': 1}}, margin=0)
+    assert admission.admit('t1', big(env, 't1')) is None
+    calls = disk.calls
+
+    def no_io(*args):
+        raise AssertionError('filesystem touched')
+
+    admission.allocated = no_io
+    assert '上限 1' in admission.admit('t2', big(env, 't2'))
+    assert disk.calls == calls
+    assert admission.stats() == {daemon.mount_point(env.out): {'writers': 1, 'limit': 1}}
+
+    del admission.allocated
+    admission.release('t1')
+    assert admission.admit('t2', big(env, 't2')) is None
+
+
+def test_space_is_reserved_for_running_tasks(env, admission, disk):
+    assert admission.admit('t1', big(env, 't1')) is None
+    assert admission.admit('t2', big(env, 't2')) is None
+    assert '磁盘空间不足' in admission.admit('t3', big(env, 't3'))
+
+    # t1 has written everything it reserved, which the free space now reflects
+    admission.consume('t1', 5 * MB)
+    disk.free -= 5 * MB
+    admission.release('t2')
+    assert admission.admit('t3', big(env, 't3')) is None
+
+
+def test_resumed_task_only_needs_the_rest(env, admission, disk):
+    disk.free = 3 * MB
+    task = big(env, 't1', progress={'downloaded': 3 * MB})
+    assert admission.admit('t1', task) is None
+
+
+def test_margin_is_kept_free(env, admission, disk):
+    admission.configure(margin=6 * MB, write_mode='parts')
+    assert '磁盘空间不足' in admission.admit('t1', big(env, 't1'))
+
+
+def test_task_larger_than_the_filesystem_fails(env, admission, disk):
+    disk.free = disk.size = 4 * MB
+    with pytest.raises(DiskSpaceError):
+        admission.admit('t1', big(env, 't1'))
+
+
+def test_check_can_assume_a_victim_is_released(env, admission, disk):
+    admission.configure({'default': {'maxWriters': 1}}, margin=0)
+    assert admission.admit('low', big(env, 'low')) is None
+
+    assert admission.check('urgent', big(env, 'urgent')) is not None
+    assert admission.check('urgent', big(env, 'urgent'), release='low') is None
+    assert admission.stats()[daemon.mount_point(env.out)]['writers'] == 1
+
+
+def test_daemon_defers_or_fails_tasks_that_do_not_fit(env, disk):
+    env.write_config(diskFreeMarginMB=0, writeMode='parts')
+    instance = env.daemon()
+    for task_id, size in (('t1', 6 * MB), ('t2', 6 * MB), ('huge', 200 * MB)):
+        instance.db.add_task(task_id, big(env, task_id, size=size))
+
+    assert instance.admit_task('t1', instance.db.get_task('t1'))
+    assert not instance.admit_task('t2', instance.db.get_task('t2'))
+    assert instance.db.get_task('t2')['status'] == 'pending'
+    assert not instance.admit_task('huge', instance.db.get_task('huge'))
+    assert instance.db.get_task('huge')['status'] == 'failed'
+
+
+def test_download_reports_the_space_it_uses(env, obs_server):
+    obs_server.put('obj.bin', os.urandom(512 * KB))
+    env.write_config(diskFreeMarginMB=0)
+    instance = env.daemon()
+    task = env.task('t1', 'obj.bin', total_size=512 * KB, piece_size=128 * KB)
+    assert instance.admission.admit('t1', task) is None
+
+    assert env.run(instance.db, instance.executor, task)['status'] == 'completed'
+
+    reserved, used = instance.admission._writers[daemon.mount_point(env.out)]['t1']
+    assert used >= 512 * KB
+    instance._on_task_done('t1')
+    assert instance.admission.stats() == {}
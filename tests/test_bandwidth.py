@@ -0,0 +1,98 @@
+"""Token-bucket bandwidth limits, global and per user."""
+import json
+import os
+import threading
+import time
+
+from linux_server import daemon
+from linux_server.daemon import BandwidthLimiter, TokenBucket
+
+KB = 1024
+MB = 1024 * KB
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+    assert timed(bucket.consume, 100 * MB) < 0.05
+
+
+def test_bucket_holds_the_rate_across_threads():
+    bucket = TokenBucket(1 * MB)
+
+    def consume():
+        for _ in range(4):
+            bucket.consume(64 * KB)
+
+    threads = [threading.Thread(target=consume) for _ in range(2)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 512 KiB at 1 MiB/s, starting from an empty bucket
+    assert 0.4 < time.time() - start < 1.0
+
+
+def test_abort_cuts_the_wait_short():
+    bucket = TokenBucket(1 * KB)
+    abort = threading.Event()
+    abort.set()
+    assert timed(bucket.consume, 10 * MB, abort) < 0.05
+
+
+def test_user_limits_are_separate_and_capped_by_the_global_rate():
+    limiter = BandwidthLimiter()
+    limiter.configure(global_rate=10 * MB, user_rates={'alice': 2 * MB}, default_user_rate=4 * MB)
+
+    assert limiter.effective_limit('alice') == 2 * MB
+    assert limiter.effective_limit('bob') == 4 * MB
+    assert 0.4 < timed(limiter.throttle, 'alice', 1 * MB) < 0.7
+    assert 0.15 < timed(limiter.throttle, 'bob', 1 * MB) < 0.4
+
+    limiter.configure(global_rate=1 * MB)
+    assert limiter.effective_limit('alice') == 1 * MB
+    assert limiter._user_bucket('alice').rate == 0
+
+
+def test_mount_limits_apply_to_writes_on_that_mount():
+    limiter = BandwidthLimiter()
+    limiter.configure(mount_rates={'/data': 1 * MB})
+    assert timed(limiter.throttle, 'alice', 256 * KB, None, '/other') < 0.05
+    assert timed(limiter.throttle, 'alice', 256 * KB, None, '/data') > 0.2
+    assert limiter.stats()['mount_rates'] == {'/data': 1 * MB}
+
+
+def test_daemon_reads_limits_from_config_and_the_control_file(env):
+    env.write_config(bandwidthLimitMBps=100, userBandwidthLimitMBps={'default': 10, 'alice': 5})
+    instance = env.daemon()
+    assert instance.executor.bandwidth.stats()['global_rate'] == 100 * MB
+    assert instance.executor.bandwidth.effective_limit('alice') == 5 * MB
+
+    with open(daemon.RATE_LIMITS_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'bandwidthLimitMBps': 1, 'userBandwidthLimitMBps': {'alice': 0}}, f)
+    instance.reload_rate_limits()
+
+    assert instance.executor.bandwidth.stats()['global_rate'] == 1 * MB
+    assert instance.executor.bandwidth.effective_limit('alice') == 1 * MB
+    assert instance.executor.bandwidth.effective_limit('bob') == 1 * MB
+
+
+def test_download_is_throttled_to_the_user_limit(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(1 * MB))
+    db, executor = env.executor()
+    executor.bandwidth.configure(user_rates={'tester': 2 * MB})
+
+    start = time.time()
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=256 * KB))
+
+    assert task['status'] == 'completed'
+    assert time.time() - start > 0.45
+    assert task['progress']['percentage'] == 100
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
@@ -0,0 +1,74 @@
+"""Many tasks are inserted in one transaction instead of one locked rewrite each."""
+import os
+
+import pytest
+
+from linux_server import task_manager
+from linux_server.task_manager import TaskManager
+
+
+def tasks(n, **fields):
+    return [dict({'id': f't{i}', 'status': 'pending', 'created_by': 'tester', 'created_at': i}, **fields)
+            for i in range(n)]
+
+
+def test_add_tasks_inserts_everything(status_store):
+    assert status_store.add_tasks(tasks(500)) == 500
+
+    stored = status_store.get_tasks('pending')
+    assert list(stored) == [f't{i}' for i in range(500)]
+    assert all(task['queued_at'] for task in stored.values())
+    assert status_store.count_by_user() == {'tester': {'pending': 500}}
+
+
+def test_add_tasks_is_all_or_nothing(status_store):
+    batch = tasks(3)
+    del batch[2]['id']
+
+    with pytest.raises(KeyError):
+        status_store.add_tasks(batch)
+
+    assert status_store.get_tasks() == {}
+
+
+def test_task_manager_reports_the_insert_time(status_store):
+    elapsed = TaskManager().add_tasks(tasks(10))
+
+    assert isinstance(elapsed, float) and elapsed >= 0
+    assert len(status_store.get_tasks()) == 10
+
+
+def test_unique_ids_within_one_second(monkeypatch):
+    tm = TaskManager()
+    monkeypatch.setattr(tm, '_generate_task_id', lambda: 'task_1_1234')
+    used = set()
+
+    ids = [tm._generate_unique_task_id(used) for _ in range(3)]
+
+    assert ids == ['task_1_1234', 'task_1_1234_1', 'task_1_1234_2']
+
+
+def test_folder_sync_uses_the_bulk_insert(env, obs_server, folder_sync, status_store, monkeypatch):
+    for i in range(50):
+        obs_server.put(f'data/f{i:02d}.bin', os.urandom(16))
+
+    def add_task(task_id, data):
+        raise AssertionError('per-task insert used')
+
+    monkeypatch.setattr(task_manager, 'add_task', add_task)
+    report = {}
+    task_ids = folder_sync.batch_create_tasks('bucket', 'data/', env.out, 'tester',
+                                              small_threshold=0, report=report)
+
+    assert len(set(task_ids)) == 50
+    assert report['scheduled'] == 50 and report['insert_seconds'] >= 0
+    assert sorted(task['object_key'] for task in status_store.get_tasks().values()) == \
+        sorted(obs_server.objects)
+
+
+def test_daemon_sees_a_bulk_insert(env, status_store, wait_until):
+    db, executor = env.executor()
+
+    status_store.add_tasks(tasks(20))
+
+    wait_until(lambda: len(db.get_tasks('pending')) == 20)
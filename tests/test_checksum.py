@@ -0,0 +1,144 @@
+"""Piece and whole-object checksums computed while streaming."""
+import base64
+import hashlib
+import importlib.util
+import json
+import os
+
+from linux_server.daemon import expected_checksum, md5_from_etag
+
+KB = 1024
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_expected_checksum_prefers_metadata_over_the_etag():
+    md5 = hashlib.md5(b'x').hexdigest()
+    sha256 = hashlib.sha256(b'x').hexdigest()
+    assert expected_checksum({'x-obs-meta-sha256': sha256}, md5) == ('sha256', sha256)
+    assert expected_checksum({'content-md5': base64.b64encode(bytes.fromhex(md5)).decode()}, None) == ('md5', md5)
+    assert expected_checksum({}, md5) == ('md5', md5)
+    assert expected_checksum({'x-obs-server-side-encryption': 'kms'}, md5) is None
+    assert md5_from_etag(f'"{md5}-3"') is None
+
+
+def test_completed_task_records_the_verified_md5(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(700 * KB))
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'completed'
+    assert task['checksum'] == {'algorithm': 'md5', 'value': hashlib.md5(data).hexdigest(),
+                                'verified': True}
+
+
+def test_sha256_metadata_selects_sha256(env, obs_server):
+    data = os.urandom(300 * KB)
+    obs_server.put('obj.bin', data, headers={'x-obs-meta-sha256': hashlib.sha256(data).hexdigest()})
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['checksum'] == {'algorithm': 'sha256', 'value': hashlib.sha256(data).hexdigest(),
+                                'verified': True}
+
+
+def test_multipart_object_digest_is_recorded_unverified(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(300 * KB), etag='0123456789abcdef0123456789abcdef-3')
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'completed'
+    assert task['checksum'] == {'algorithm': 'md5', 'value': hashlib.md5(data).hexdigest(),
+                                'verified': False}
+
+
+def test_verification_can_be_disabled(env, obs_server):
+    obs_server.put('obj.bin', os.urandom(300 * KB), etag='0' * 32)
+    env.write_config(verifyChecksum=False)
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'completed'
+    assert task['checksum'] is None
+
+
+def test_mismatch_fails_and_the_retry_downloads_everything(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB), etag='0' * 32)
+    db, executor = env.executor()
+    task = env.task('t1', 'obj.bin', piece_size=128 * KB)
+
+    failed = env.run(db, executor, task)
+    assert failed['status'] == 'failed'
+    assert '文件校验失败' in failed['error']
+    assert not os.path.exists(env.path('obj.bin'))
+
+    obs_server.etags['obj.bin'] = hashlib.md5(data).hexdigest()
+    del obs_server.gets[:]
+    assert env.run(db, executor, task)['status'] == 'completed'
+    assert len(obs_server.gets) == 4
+    assert read(env.path('obj.bin')) == data
+
+
+def test_corrupted_resumed_piece_is_detected(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+
+    def fail_last_piece(key, start, end):
+        if start == 384 * KB:
+            raise IOError('connection reset')
+
+    obs_server.hooks.append(fail_last_piece)
+    env.write_config(chunkConcurrency=1)
+    db, executor = env.executor()
+    task = env.task('t1', 'obj.bin', piece_size=128 * KB, maxRetries=1)
+    assert env.run(db, executor, task)['status'] == 'failed'
+
+    part = os.path.join(env.out, '.t1_chunks', 'obj.bin.part1')
+    with open(part, 'r+b') as f:
+        f.write(bytes([data[0] ^ 0xff]))
+    obs_server.hooks.clear()
+
+    failed = env.run(db, executor, task)
+    assert failed['status'] == 'failed'
+    assert 'MD5校验失败' in failed['error']
+
+    del obs_server.gets[:]
+    assert env.run(db, executor, task)['status'] == 'completed'
+    assert len(obs_server.gets) == 4
+    assert read(env.path('obj.bin')) == data
+
+
+def load_chunk_downloader():
+    """Load the standalone script fresh so it binds the fake SDK installed for this test."""
+    path = os.path.join(ROOT, 'obs_chunk_downloader', 'obs_chunk_downloader.py')
+    spec = importlib.util.spec_from_file_location('obs_chunk_downloader_under_test', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_chunk_downloader_mismatch_removes_parts_and_manifest(tmp_path, obs_server, monkeypatch):
+    data = obs_server.put('dir/obj.bin', os.urandom(300 * KB), etag='0' * 32)
+    out = tmp_path / 'out'
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({'objectKey': 'dir/obj.bin', 'localDir': str(out),
+                                  'pieceSize': 128 * KB, 'maxRetries': 1}))
+    monkeypatch.setenv('OBS_DL_CONFIG', str(config))
+    downloader = load_chunk_downloader()
+
+    downloader.main()
+    assert os.listdir(out) == []
+
+    obs_server.etags['dir/obj.bin'] = hashlib.md5(data).hexdigest()
+    del obs_server.gets[:]
+    downloader.main()
+    assert os.listdir(out) == ['obj.bin']
+    assert read(out / 'obj.bin') == data
+    assert len(obs_server.gets) == 3
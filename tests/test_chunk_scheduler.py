@@ -0,0 +1,93 @@
+"""The global range-request budget shared by all tasks."""
+import os
+import threading
+import time
+
+from linux_server.daemon import ChunkScheduler
+
+KB = 1024
+
+
+def test_acquire_blocks_once_the_budget_is_used(wait_until):
+    scheduler = ChunkScheduler(2)
+    assert scheduler.acquire('a')
+    assert scheduler.acquire('b')
+
+    granted = threading.Event()
+    thread = threading.Thread(target=lambda: scheduler.acquire('a') and granted.set())
+    thread.start()
+    wait_until(lambda: scheduler.stats()['waiting'] == 1)
+    assert not granted.wait(0.1)
+
+    scheduler.release('b')
+    assert granted.wait(2)
+    thread.join()
+    assert scheduler.inflight() == 2
+
+
+def test_free_slots_rotate_between_waiting_tasks(wait_until):
+    scheduler = ChunkScheduler(1)
+    assert scheduler.acquire('a')
+    order = []
+
+    def worker(task_id):
+        scheduler.acquire(task_id)
+        order.append(task_id)
+        scheduler.release(task_id)
+
+    threads = [threading.Thread(target=worker, args=('a',)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: scheduler.stats()['waiting'] == 2)
+    threads.append(threading.Thread(target=worker, args=('b',)))
+    threads[-1].start()
+    wait_until(lambda: scheduler.stats()['waiting'] == 3)
+
+    scheduler.release('a')
+    for thread in threads:
+        thread.join(5)
+    assert order == ['a', 'b', 'a']
+    assert scheduler.inflight() == 0
+
+
+def test_aborted_acquire_leaves_the_queue():
+    scheduler = ChunkScheduler(1)
+    assert scheduler.acquire('a')
+    abort = threading.Event()
+    abort.set()
+
+    assert scheduler.acquire('b', abort) is False
+    assert scheduler.stats()['waiting'] == 0
+    scheduler.release('a')
+    scheduler.unregister('b')
+    assert scheduler.acquire('c')
+
+
+def test_lowering_the_limit_holds_new_requests_back():
+    scheduler = ChunkScheduler(4)
+    scheduler.set_limit(1)
+    assert scheduler.acquire('a')
+    abort = threading.Event()
+    threading.Timer(0.1, abort.set).start()
+    assert scheduler.acquire('a', abort) is False
+    scheduler.set_limit(10)
+    assert scheduler.limit == 4
+
+
+def test_concurrent_tasks_stay_within_the_shared_budget(env, obs_server):
+    for name in ('a.bin', 'b.bin'):
+        obs_server.put(name, os.urandom(512 * KB))
+    obs_server.hooks.append(lambda key, start, end: time.sleep(0.02))
+    env.write_config(chunkConcurrency=4)
+    db, executor = env.executor(max_inflight=3, adaptive_concurrency=False, hedge_enabled=False)
+
+    threads = [threading.Thread(target=env.run, args=(db, executor, env.task(f't{i}', name, piece_size=64 * KB)))
+               for i, name in enumerate(('a.bin', 'b.bin'))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert [db.get_task(t)['status'] for t in ('t0', 't1')] == ['completed', 'completed']
+    assert obs_server.max_inflight <= 3
+    assert executor.chunk_scheduler.stats()['total_granted'] == 16
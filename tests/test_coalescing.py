@@ -0,0 +1,132 @@
+"""Concurrent downloads of the same object are coalesced into one."""
+import os
+import threading
+
+from linux_server.daemon import clone_file
+
+KB = 1024
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def gate(obs_server):
+    """Hold every GET until the returned event is set."""
+    release = threading.Event()
+    obs_server.hooks.append(lambda key, start, end: release.wait(10))
+    return release
+
+
+def test_clone_file_copies_content_atomically(tmp_path):
+    src = tmp_path / 'src'
+    src.write_bytes(b'payload')
+    dst = tmp_path / 'sub' / 'dst'
+    dst.parent.mkdir()
+    dst.write_bytes(b'old')
+
+    assert clone_file(str(src), str(dst)) in ('reflink', '硬链接', '复制')
+    assert dst.read_bytes() == b'payload'
+    assert sorted(os.listdir(dst.parent)) == ['dst']
+    assert clone_file(str(src), str(src)) == '同一路径'
+
+
+def test_pending_task_attaches_to_the_running_download(env, obs_server):
+    data = obs_server.put('dir/obj.bin', os.urandom(512 * KB))
+    release = gate(obs_server)
+    db, executor = env.executor()
+    owner = env.task('t1', 'dir/obj.bin', piece_size=128 * KB)
+    follower = env.task('t2', 'dir/obj.bin', target_dir=os.path.join(env.root, 'other'))
+    for task in (owner, follower):
+        db.add_task(task['id'], task)
+
+    assert executor.submit_task('t1', owner)
+    future = executor.running_tasks['t1']['future']
+    assert executor.coalesce('t2', follower) == 't1'
+    assert db.get_task('t2')['status'] == 'attached'
+    release.set()
+    future.result(10)
+
+    assert db.get_task('t1')['status'] == 'completed'
+    shared = db.get_task('t2')
+    assert shared['status'] == 'completed'
+    assert shared['checksum'] == db.get_task('t1')['checksum']
+    assert read(os.path.join(env.root, 'other', 'obj.bin')) == data
+    assert len(obs_server.gets) == 4
+
+
+def test_tasks_that_reach_head_together_share_one_download(env, obs_server, wait_until):
+    data = obs_server.put('dir/obj.bin', os.urandom(512 * KB))
+    release = gate(obs_server)
+    db, executor = env.executor()
+    owner = env.task('t1', 'dir/obj.bin', piece_size=128 * KB)
+    follower = env.task('t2', 'dir/obj.bin', piece_size=128 * KB, target_dir=os.path.join(env.root, 'other'))
+
+    thread = threading.Thread(target=env.run, args=(db, executor, owner))
+    thread.start()
+    wait_until(lambda: obs_server.gets)
+    assert env.run(db, executor, follower)['status'] == 'attached'
+    release.set()
+    thread.join(10)
+
+    assert db.get_task('t2')['status'] == 'completed'
+    assert read(os.path.join(env.root, 'other', 'obj.bin')) == data
+    assert len(obs_server.gets) == 4
+
+
+def test_follower_is_requeued_when_the_owner_fails(env, obs_server):
+    obs_server.put('dir/obj.bin', os.urandom(512 * KB))
+    release = gate(obs_server)
+
+    def fail(key, start, end):
+        raise IOError('connection reset')
+
+    obs_server.hooks.append(fail)
+    db, executor = env.executor()
+    owner = env.task('t1', 'dir/obj.bin', piece_size=128 * KB, maxRetries=1)
+    follower = env.task('t2', 'dir/obj.bin', target_dir=os.path.join(env.root, 'other'))
+    for task in (owner, follower):
+        db.add_task(task['id'], task)
+
+    assert executor.submit_task('t1', owner)
+    future = executor.running_tasks['t1']['future']
+    assert executor.coalesce('t2', follower) == 't1'
+    release.set()
+    future.result(10)
+
+    assert db.get_task('t1')['status'] == 'failed'
+    assert db.get_task('t2')['status'] == 'pending'
+    assert db.get_task('t2')['attached_to'] is None
+
+
+def test_overwritten_object_is_not_coalesced(env, obs_server, wait_until):
+    obs_server.put('dir/obj.bin', os.urandom(512 * KB))
+    release = gate(obs_server)
+    db, executor = env.executor()
+    owner = env.task('t1', 'dir/obj.bin', piece_size=128 * KB)
+    db.add_task('t1', owner)
+    assert executor.submit_task('t1', owner)
+    future = executor.running_tasks['t1']['future']
+    wait_until(lambda: obs_server.gets)
+
+    stale = env.task('t2', 'dir/obj.bin', etag='0' * 32)
+    assert executor.coalesce('t2', stale) is None
+    db.add_task('t3', env.task('t3', 'dir/obj.bin'))
+    assert executor.coalesce('t3', db.get_task('t3')) == 't1'
+    release.set()
+    future.result(10)
+
+
+def test_redownload_does_not_rewrite_a_shared_hardlink(env, obs_server):
+    old = obs_server.put('dir/obj.bin', os.urandom(300 * KB))
+    db, executor = env.executor()
+    assert env.run(db, executor, env.task('t1', 'dir/obj.bin', piece_size=128 * KB))['status'] == 'completed'
+    shared = os.path.join(env.root, 'shared.bin')
+    os.link(env.path('obj.bin'), shared)
+
+    new = obs_server.put('dir/obj.bin', os.urandom(300 * KB))
+    assert env.run(db, executor, env.task('t2', 'dir/obj.bin', piece_size=128 * KB))['status'] == 'completed'
+
+    assert read(env.path('obj.bin')) == new
+    assert read(shared) == old
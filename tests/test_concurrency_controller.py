@@ -0,0 +1,109 @@
+"""AIMD control of the global in-flight window."""
+import os
+import socket
+import time
+
+from linux_server.daemon import ChunkScheduler, ConcurrencyController, is_throttle_error
+
+KB = 1024
+
+
+def saturate(controller):
+    for _ in range(controller.window):
+        controller.scheduler.acquire('t')
+    controller.on_request_start()
+    for _ in range(controller.window):
+        controller.scheduler.release('t')
+
+
+def test_starts_at_a_quarter_of_the_budget():
+    scheduler = ChunkScheduler(16)
+    controller = ConcurrencyController(scheduler, min_window=2)
+    assert controller.window == 4
+    assert scheduler.limit == 4
+
+
+def test_disabled_controller_uses_the_whole_budget():
+    scheduler = ChunkScheduler(16)
+    controller = ConcurrencyController(scheduler, enabled=False)
+    assert controller.window == scheduler.limit == 16
+    assert controller.on_error(RuntimeError('HTTP 503 SlowDown')) is True
+    assert controller.window == 16
+
+
+def test_throttling_halves_the_window_once_per_interval():
+    scheduler = ChunkScheduler(16)
+    controller = ConcurrencyController(scheduler, min_window=1, initial_window=8, interval=60)
+
+    assert controller.on_error(RuntimeError('HTTP 503 SlowDown')) is True
+    assert controller.window == scheduler.limit == 4
+    controller.on_error(RuntimeError('HTTP 429'))
+    assert controller.window == 4
+    assert controller.stats()['decreases'] == 1
+
+
+def test_window_never_drops_below_the_minimum():
+    scheduler = ChunkScheduler(16)
+    controller = ConcurrencyController(scheduler, min_window=3, initial_window=4, interval=0)
+    controller.on_error(TimeoutError())
+    controller.on_error(TimeoutError())
+    assert controller.window == 3
+
+
+def test_other_errors_leave_the_window_alone():
+    controller = ConcurrencyController(ChunkScheduler(16), initial_window=8)
+    assert controller.on_error(RuntimeError('HTTP 404 NoSuchKey')) is False
+    assert controller.window == 8
+
+
+def test_saturated_window_grows_while_throughput_improves():
+    scheduler = ChunkScheduler(16)
+    controller = ConcurrencyController(scheduler, initial_window=4, interval=0.02)
+
+    saturate(controller)
+    time.sleep(0.03)
+    controller.on_success(1024 * KB)
+    assert controller.window == scheduler.limit == 5
+
+    # Throughput fell: no increase even though the window was full
+    saturate(controller)
+    time.sleep(0.03)
+    controller.on_success(1)
+    assert controller.window == 5
+    assert controller.stats()['increases'] == 1
+    assert controller.stats()['recent_decisions'][-1]['action'] == 'increase'
+
+
+def test_unsaturated_window_does_not_grow():
+    controller = ConcurrencyController(ChunkScheduler(16), initial_window=4, interval=0.02)
+    time.sleep(0.03)
+    controller.on_success(1024 * KB)
+    assert controller.window == 4
+
+
+def test_throttle_errors_are_recognised():
+    assert is_throttle_error(socket.timeout())
+    assert is_throttle_error(RuntimeError('HTTP 503 ServiceUnavailable'))
+    assert is_throttle_error(RuntimeError('read timed out'))
+    assert not is_throttle_error(RuntimeError('HTTP 403 AccessDenied'))
+
+
+def test_download_backs_off_on_slow_down_and_completes(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+    throttled = []
+
+    def slow_down_once(key, start, end):
+        if start == 0 and not throttled:
+            throttled.append(start)
+            raise RuntimeError('HTTP 503 SlowDown')
+
+    obs_server.hooks.append(slow_down_once)
+    db, executor = env.executor(max_inflight=8, min_inflight=1)
+    window = executor.concurrency.window
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'completed'
+    assert executor.concurrency.window == window // 2
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
@@ -0,0 +1,77 @@
+"""Direct write mode: pieces are written in place into a preallocated hidden file."""
+import os
+
+from linux_server.daemon import DirectFileStore
+
+KB = 1024
+
+
+def write_piece(store, index, data):
+    start = (index - 1) * store.piece_size
+    with store.open_piece(index, start) as writer:
+        writer.write(data[start:start + store.piece_size])
+    store.mark_done(index)
+
+
+def test_scan_preallocates_and_resumes_from_the_bitmap(tmp_path):
+    data = os.urandom(300 * KB)
+    store = DirectFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    assert store.scan() == ([], [1, 2, 3])
+    assert os.path.getsize(store.data_path) == len(data)
+    write_piece(store, 1, data)
+    write_piece(store, 3, data)
+    store.close()
+
+    resumed = DirectFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    assert resumed.scan() == ([1, 3], [2])
+    write_piece(resumed, 2, data)
+    assert resumed.finalize() == str(tmp_path / 'obj.bin')
+    assert (tmp_path / 'obj.bin').read_bytes() == data
+    assert sorted(os.listdir(tmp_path)) == ['obj.bin']
+
+
+def test_changed_etag_discards_previous_progress(tmp_path):
+    store = DirectFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, 300 * KB, 'old')
+    store.scan()
+    store.mark_done(1)
+    store.close()
+
+    store = DirectFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, 300 * KB, 'new')
+    assert store.scan() == ([], [1, 2, 3])
+    store.close()
+
+
+def test_direct_download_writes_the_target_without_part_files(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(700 * KB + 3))
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB, write_mode='direct'))
+
+    assert task['status'] == 'completed'
+    assert task['write_mode'] == 'direct'
+    assert sorted(os.listdir(env.out)) == ['obj.bin']
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+
+
+def test_interrupted_direct_download_resumes_missing_pieces(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+
+    def fail_last_piece(key, start, end):
+        if start == 384 * KB:
+            raise IOError('connection reset')
+
+    obs_server.hooks.append(fail_last_piece)
+    env.write_config(chunkConcurrency=1)
+    db, executor = env.executor()
+    task = env.task('t1', 'obj.bin', piece_size=128 * KB, write_mode='direct', maxRetries=1)
+
+    assert env.run(db, executor, task)['status'] == 'failed'
+    assert not os.path.exists(env.path('obj.bin'))
+
+    obs_server.hooks.clear()
+    del obs_server.gets[:]
+    assert env.run(db, executor, task)['status'] == 'completed'
+    assert obs_server.ranges() == [(384 * KB, 512 * KB - 1)]
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
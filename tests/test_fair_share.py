@@ -0,0 +1,77 @@
+"""Weighted deficit round robin across the users that created the tasks."""
+from linux_server.daemon import FairShareScheduler
+from linux_server.task_manager import TaskManager
+
+
+def queue(**counts):
+    """Pending tasks per user, each user's tasks queued after the previous user's."""
+    pending = {}
+    for user, count in counts.items():
+        for i in range(count):
+            pending[f'{user}{i}'] = {'created_by': user, 'queued_at': len(pending)}
+    return pending
+
+
+def users(selected):
+    return [task['created_by'] for task_id, task in selected]
+
+
+def test_users_are_interleaved_instead_of_fifo():
+    scheduler = FairShareScheduler()
+    selected = scheduler.select(queue(alice=6, bob=2), {}, slots=4)
+
+    assert [task_id for task_id, task in selected] == ['alice0', 'bob0', 'alice1', 'bob1']
+
+
+def test_weights_set_each_users_share():
+    scheduler = FairShareScheduler({'alice': 3})
+
+    assert users(scheduler.select(queue(alice=10, bob=10), {}, slots=8)) == \
+        ['alice'] * 3 + ['bob'] + ['alice'] * 3 + ['bob']
+
+
+def test_unused_deficit_carries_over_between_rounds():
+    scheduler = FairShareScheduler({'alice': 2})
+    pending = queue(alice=4, bob=4)
+    picked = []
+    for _ in range(3):
+        task_id, task = scheduler.select(pending, {}, slots=1)[0]
+        del pending[task_id]
+        picked.append(task['created_by'])
+
+    assert picked == ['alice', 'alice', 'bob']
+
+
+def test_running_cap_per_user():
+    scheduler = FairShareScheduler(max_running_per_user=2)
+    selected = scheduler.select(queue(alice=5, bob=5), {'alice': 1}, slots=5)
+
+    assert users(selected).count('alice') == 1
+    assert users(selected).count('bob') == 2
+
+
+def test_tasks_refused_admission_are_skipped_without_using_the_share():
+    scheduler = FairShareScheduler()
+    selected = scheduler.select(queue(alice=3, bob=2), {}, slots=3,
+                                admit=lambda task_id, task: task_id != 'alice0')
+
+    assert [task_id for task_id, task in selected] == ['alice1', 'bob0', 'alice2']
+
+
+def test_stats_report_queue_depth_and_weight():
+    scheduler = FairShareScheduler({'alice': 2, 'default': 0.5})
+
+    assert scheduler.stats(queue(alice=2, bob=1), {'carol': 1}) == {
+        'alice': {'pending': 2, 'running': 0, 'weight': 2.0},
+        'bob': {'pending': 1, 'running': 0, 'weight': 0.5},
+        'carol': {'pending': 0, 'running': 1, 'weight': 0.5},
+    }
+
+
+def test_list_shows_per_user_queue_depth(status_store):
+    status_store.add_tasks([dict(task, id=task_id, status='pending')
+                            for task_id, task in queue(alice=3, bob=1).items()])
+    status_store.update_task('alice0', {'status': 'running'})
+    status_store.update_task('bob0', {'status': 'completed'})
+
+    assert TaskManager().queue_depth_by_user() == {'alice': {'pending': 2, 'running': 1, 'paused': 0}}
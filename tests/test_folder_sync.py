@@ -0,0 +1,58 @@
+"""Folder sync skips objects whose local copy is already identical."""
+import os
+
+KB = 1024
+
+
+def test_identical_by_download_record(tmp_path, folder_sync):
+    path = tmp_path / 'obj.bin'
+    path.write_bytes(b'x' * 10)
+    st = os.stat(path)
+    obj = {'key': 'dir/obj.bin', 'size': 10, 'etag': 'e1', 'last_modified': int(st.st_mtime) + 100}
+    record = {'bucket': 'b', 'object_key': 'dir/obj.bin', 'size': 10, 'mtime': int(st.st_mtime), 'etag': 'e1'}
+
+    assert folder_sync.is_identical(obj, str(path), 'b', {str(path): record})
+    assert not folder_sync.is_identical(dict(obj, etag='e2'), str(path), 'b', {str(path): record})
+    assert not folder_sync.is_identical(obj, str(path), 'other', {str(path): record})
+    assert not folder_sync.is_identical(obj, str(path), 'b', {str(path): dict(record, mtime=1)})
+    assert not folder_sync.is_identical(dict(obj, size=11), str(path), 'b', {str(path): record})
+
+
+def test_identical_by_size_and_mtime_without_a_record(tmp_path, folder_sync):
+    path = tmp_path / 'obj.bin'
+    path.write_bytes(b'x' * 10)
+    mtime = int(os.stat(path).st_mtime)
+
+    assert folder_sync.is_identical({'size': 10, 'last_modified': mtime}, str(path), 'b', {})
+    assert not folder_sync.is_identical({'size': 10, 'last_modified': mtime + 1}, str(path), 'b', {})
+    assert not folder_sync.is_identical({'size': 10}, str(tmp_path / 'missing'), 'b', {})
+
+
+def test_sync_skips_files_the_daemon_already_downloaded(env, obs_server, folder_sync):
+    obs_server.put('data/a.bin', os.urandom(300 * KB))
+    obs_server.put('data/b.bin', os.urandom(300 * KB))
+    db, executor = env.executor()
+    for i, key in enumerate(('data/a.bin', 'data/b.bin')):
+        assert env.run(db, executor, env.task(f't{i}', key))['status'] == 'completed'
+    db.flush()
+    with open(env.path('b.bin'), 'ab') as f:
+        f.write(b'changed locally')
+
+    report = {}
+    task_ids = folder_sync.batch_create_tasks('bucket', 'data/', env.out, 'tester',
+                                              small_threshold=0, report=report)
+
+    assert len(task_ids) == 1
+    assert report['skipped'] == 1 and report['skipped_bytes'] == 300 * KB
+    assert report['scheduled'] == 1
+
+
+def test_skip_can_be_disabled(env, obs_server, folder_sync):
+    obs_server.put('data/a.bin', os.urandom(10 * KB))
+    os.makedirs(env.out)
+    with open(env.path('a.bin'), 'wb') as f:
+        f.write(obs_server.objects['data/a.bin'])
+
+    assert folder_sync.batch_create_tasks('bucket', 'data/', env.out, 'tester', small_threshold=0) == []
+    assert len(folder_sync.batch_create_tasks('bucket', 'data/', env.out, 'tester', small_threshold=0,
+                                              skip_identical=False)) == 1
@@ -0,0 +1,85 @@
+"""Hedged range GETs for pieces that straggle past a latency-percentile deadline."""
+import os
+import threading
+import time
+
+import pytest
+
+from linux_server.daemon import RequestHedger
+
+KB = 1024
+
+
+def test_no_deadline_until_enough_samples():
+    hedger = RequestHedger(percentile=90, min_delay=0.0)
+    for _ in range(RequestHedger.MIN_SAMPLES - 1):
+        hedger.record(128 * KB, 0.1)
+    assert hedger.deadline(128 * KB) is None
+    hedger.record(128 * KB, 0.1)
+    assert hedger.deadline(128 * KB) == 0.1
+    # Samples are kept per power-of-two size class
+    assert hedger.deadline(1024 * KB) is None
+    hedger.shutdown()
+
+
+def test_deadline_is_the_percentile_with_a_floor():
+    hedger = RequestHedger(percentile=90, min_delay=0.0)
+    for i in range(100):
+        hedger.record(128 * KB, i / 100)
+    assert hedger.deadline(128 * KB) == 0.9
+    hedger.min_delay = 2.0
+    assert hedger.deadline(128 * KB) == 2.0
+    hedger.shutdown()
+
+
+def test_disabled_hedger_never_sets_a_deadline():
+    hedger = RequestHedger(enabled=False)
+    for _ in range(50):
+        hedger.record(128 * KB, 0.1)
+    assert hedger.deadline(128 * KB) is None
+    hedger.shutdown()
+
+
+def test_launch_is_bounded_by_the_hedge_slots():
+    hedger = RequestHedger(max_inflight=1)
+    release = threading.Event()
+    assert hedger.launch(release.wait)
+    assert not hedger.launch(release.wait)
+    release.set()
+    assert hedger.stats()['hedges'] == 1 and hedger.stats()['skipped'] == 1
+    hedger.shutdown()
+
+
+@pytest.mark.parametrize('write_mode', ['parts', 'direct'])
+def test_straggling_piece_is_won_by_the_hedge(env, obs_server, write_mode):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+    stalled = threading.Event()
+    seen = []
+
+    def stall_first_request(key, start, end):
+        if start == 128 * KB and not seen:
+            seen.append(start)
+            stalled.wait(10)
+
+    obs_server.hooks.append(stall_first_request)
+    db, executor = env.executor()
+    executor.hedger.min_delay = 0.05
+    for _ in range(RequestHedger.MIN_SAMPLES):
+        executor.hedger.record(128 * KB, 0.01)
+
+    task = env.task('t1', 'obj.bin', piece_size=128 * KB, write_mode=write_mode)
+
+    started = time.time()
+    try:
+        task = env.run(db, executor, task)
+        elapsed = time.time() - started
+    finally:
+        stalled.set()
+
+    assert task['status'] == 'completed'
+    assert elapsed < 5
+    assert obs_server.ranges().count((128 * KB, 256 * KB - 1)) == 2
+    assert executor.hedger.stats()['wins'] == 1
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(env.out) == ['obj.bin']
@@ -0,0 +1,68 @@
+"""Merging part files with kernel-side copies."""
+import os
+
+import pytest
+
+from linux_server.daemon import PartFileStore, copy_file_data
+
+KB = 1024
+
+
+def copy(tmp_path, data, count, offset=0, buffer=None):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.write_bytes(data)
+    fd_in = os.open(src, os.O_RDONLY)
+    fd_out = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    try:
+        os.lseek(fd_in, offset, os.SEEK_SET)
+        copied = copy_file_data(fd_in, fd_out, count, buffer)
+    finally:
+        os.close(fd_in)
+        os.close(fd_out)
+    return copied, dst.read_bytes()
+
+
+def test_copies_from_the_current_offset(tmp_path):
+    data = os.urandom(300 * KB)
+    assert copy(tmp_path, data, 100 * KB, offset=50 * KB) == (100 * KB, data[50 * KB:150 * KB])
+
+
+def test_stops_at_end_of_file(tmp_path):
+    data = os.urandom(10 * KB)
+    assert copy(tmp_path, data, 20 * KB) == (10 * KB, data)
+
+
+def test_falls_back_to_the_buffer_loop(tmp_path, monkeypatch):
+    def unsupported(*args):
+        raise OSError(38, 'Function not implemented')
+
+    monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+    monkeypatch.setattr(os, 'sendfile', unsupported, raising=False)
+    data = os.urandom(300 * KB)
+    assert copy(tmp_path, data, len(data), buffer=bytearray(64 * KB)) == (len(data), data)
+
+
+def test_finalize_merges_parts_in_order_and_cleans_up(tmp_path):
+    data = os.urandom(300 * KB + 5)
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    store.scan()
+    for index in (3, 1, 2):
+        start = (index - 1) * store.piece_size
+        with store.open_piece(index, start) as f:
+            f.write(data[start:start + store.piece_size])
+        store.mark_done(index)
+
+    assert store.finalize() == str(tmp_path / 'obj.bin')
+    assert (tmp_path / 'obj.bin').read_bytes() == data
+    assert os.listdir(tmp_path) == ['obj.bin']
+
+
+def test_finalize_reports_a_missing_part(tmp_path):
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, 200 * KB, 'etag')
+    store.scan()
+    with store.open_piece(1, 0) as f:
+        f.write(b'\0' * 128 * KB)
+
+    with pytest.raises(RuntimeError, match='分片 2 不存在'):
+        store.finalize()
+    assert not os.path.exists(tmp_path / 'obj.bin')
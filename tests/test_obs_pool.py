@@ -0,0 +1,69 @@
+"""One shared ObsClient per endpoint and credentials."""
+import importlib
+import os
+import sys
+import types
+
+from linux_server.obs_pool import ObsClientPool
+
+KB = 1024
+
+
+def test_same_endpoint_and_credentials_share_a_client(obs_server):
+    pool = ObsClientPool(8)
+    client = pool.get('ak', 'sk', 'obs.example.com')
+
+    assert pool.get('ak', 'sk', 'obs.example.com') is client
+    assert pool.get('ak', 'other', 'obs.example.com') is not client
+    assert pool.get('ak', 'sk', 'obs2.example.com') is not client
+    assert len(obs_server.clients) == 3
+    assert client.kwargs['max_connections'] == 8
+    assert client.kwargs['long_conn_mode'] is True
+    assert pool.stats() == {'clients': 3, 'hits': 1, 'misses': 3,
+                            'max_connections': 8, 'limit_ignored': False}
+
+
+def test_sdk_without_a_connection_limit_is_logged(monkeypatch):
+    created = []
+
+    class OldObsClient:
+        def __init__(self, access_key_id, secret_access_key, server, long_conn_mode):
+            created.append(server)
+
+    monkeypatch.setitem(sys.modules, 'obs', types.SimpleNamespace(ObsClient=OldObsClient))
+    messages = []
+    pool = ObsClientPool(8, log=messages.append)
+
+    pool.get('ak', 'sk', 'obs.example.com')
+
+    assert created == ['obs.example.com']
+    assert pool.stats()['limit_ignored'] is True
+    assert any('does not accept max_connections' in m and '8' in m for m in messages)
+
+
+def test_close_all_empties_the_pool(obs_server):
+    pool = ObsClientPool()
+    client = pool.get('ak', 'sk', 'obs.example.com')
+    pool.close_all()
+    assert pool.get('ak', 'sk', 'obs.example.com') is not client
+
+
+def test_tasks_reuse_the_executor_client(env, obs_server):
+    for name in ('a.bin', 'b.bin'):
+        obs_server.put(name, os.urandom(300 * KB))
+    env.write_config(accessKeyId='ak', secretAccessKey='sk')
+    db, executor = env.executor()
+
+    for i, name in enumerate(('a.bin', 'b.bin')):
+        assert env.run(db, executor, env.task(f't{i}', name))['status'] == 'completed'
+
+    assert len(obs_server.clients) == 1
+    assert executor.client_pool.stats()['hits'] == 1
+
+
+def test_obs_wrappers_share_the_module_pool(obs_server, monkeypatch):
+    obs_operator = importlib.import_module('linux_server.obs_operator')
+    monkeypatch.setattr(obs_operator, '_CLIENT_POOL', ObsClientPool())
+
+    assert obs_operator.ObsWrapper().client is obs_operator.ObsWrapper().client
+    assert len(obs_server.clients) == 1
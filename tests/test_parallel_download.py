@@ -0,0 +1,60 @@
+"""Parallel range downloads of a single object."""
+import os
+import time
+
+KB = 1024
+
+
+def test_pieces_are_fetched_in_parallel_and_assembled_in_order(env, obs_server):
+    data = obs_server.put('dir/obj.bin', os.urandom(1000 * KB + 17))
+    obs_server.hooks.append(lambda key, start, end: time.sleep(0.02))
+    env.write_config(chunkConcurrency=4, writeMode='parts')
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'dir/obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'completed'
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+    assert sorted(obs_server.ranges()) == [
+        (start, min(start + 128 * KB, len(data)) - 1) for start in range(0, len(data), 128 * KB)]
+    assert obs_server.max_inflight > 1
+    assert not os.path.exists(os.path.join(env.out, '.t1_chunks'))
+
+
+def test_failed_piece_is_retried(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+    failures = []
+
+    def fail_once(key, start, end):
+        if start == 256 * KB and not failures:
+            failures.append(start)
+            raise IOError('connection reset')
+
+    obs_server.hooks.append(fail_once)
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'completed'
+    assert failures == [256 * KB]
+    assert obs_server.ranges().count((256 * KB, 384 * KB - 1)) == 2
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+
+
+def test_piece_that_keeps_failing_fails_the_task(env, obs_server):
+    obs_server.put('obj.bin', os.urandom(512 * KB))
+
+    def always_fail(key, start, end):
+        if start == 0:
+            raise IOError('connection reset')
+
+    obs_server.hooks.append(always_fail)
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'failed'
+    assert '分片 1' in task['error']
+    assert not os.path.exists(env.path('obj.bin'))
@@ -0,0 +1,44 @@
+"""Piece size chosen from object size and measured throughput."""
+import os
+
+from linux_server.daemon import PieceSizer
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+def test_without_samples_large_objects_are_capped_at_the_target_piece_count():
+    sizer = PieceSizer()
+    assert sizer.estimate() is None
+    assert sizer.choose(100 * GB) == 32 * MB
+    assert sizer.choose(10 * MB, concurrency=4) == 1 * MB
+    assert sizer.choose(10 * 1024 * GB) == 256 * MB
+
+
+def test_high_latency_and_bandwidth_raise_the_piece_size():
+    sizer = PieceSizer()
+    sizer.record(100 * MB, 0.1, 1.0)
+    assert sizer.estimate() == {'latency': 0.1, 'bandwidth': 100 * MB}
+
+    assert sizer.choose(1 * GB, concurrency=4) == 128 * MB
+    # Keeps enough pieces for the object to be downloaded in parallel
+    assert sizer.choose(100 * MB, concurrency=4) == 32 * MB
+
+
+def test_choice_respects_configured_bounds():
+    sizer = PieceSizer()
+    sizer.record(100 * MB, 1.0, 0.1)
+    assert sizer.choose(100 * GB, max_size=64 * MB) == 64 * MB
+    assert sizer.choose(1 * MB, concurrency=8, min_size=4 * MB) == 4 * MB
+
+
+def test_chosen_piece_size_is_recorded_on_the_task(env, obs_server):
+    obs_server.put('obj.bin', os.urandom(3 * MB))
+    env.write_config(chunkConcurrency=4)
+    db, executor = env.executor()
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin'))
+
+    assert task['status'] == 'completed'
+    assert task['piece_size'] == 1 * MB
+    assert len(obs_server.ranges()) == 3
@@ -0,0 +1,99 @@
+"""Task priorities: higher priority dispatches first and may preempt lower-priority running tasks."""
+import os
+import threading
+
+from linux_server import daemon
+from linux_server.daemon import FairShareScheduler
+
+KB = 1024
+
+
+def gate_after_first_piece(obs_server):
+    """Hold every GET past the first 128KB piece until the returned event is set."""
+    release = threading.Event()
+    obs_server.hooks.append(lambda key, start, end: start >= 128 * KB and release.wait(10))
+    return release
+
+
+def test_higher_priority_is_dispatched_before_older_tasks():
+    pending = {
+        'a0': {'created_by': 'alice', 'queued_at': 0},
+        'a1': {'created_by': 'alice', 'queued_at': 1, 'priority': 5},
+        'b0': {'created_by': 'bob', 'queued_at': 2, 'priority': 5},
+        'b1': {'created_by': 'bob', 'queued_at': 3},
+    }
+
+    selected = FairShareScheduler().select(pending, {}, slots=3)
+
+    assert [task_id for task_id, task in selected] == ['a1', 'b0', 'a0']
+
+
+def test_preempted_task_keeps_its_finished_pieces(env, obs_server, wait_until):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+    release = gate_after_first_piece(obs_server)
+    db, executor = env.executor()
+    low = env.task('low', 'obj.bin', piece_size=128 * KB, chunk_concurrency=1)
+    db.add_task('low', low)
+    assert executor.submit_task('low', low)
+    future = executor.running_tasks['low']['future']
+    wait_until(lambda: len(obs_server.gets) == 2)
+
+    assert executor.preempt_lowest(0) is None
+    assert executor.preempt_lowest(5) == 'low'
+    assert executor.preempt_lowest(5) is None
+    assert executor.preempting_count() == 1
+    release.set()
+    future.result(10)
+
+    requeued = db.get_task('low')
+    assert requeued['status'] == 'pending' and requeued['preempted_at']
+    obs_server.gets.clear()
+    assert env.run(db, executor, requeued)['status'] == 'completed'
+    assert (0, 128 * KB - 1) not in obs_server.ranges()
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+
+
+def test_paused_tasks_are_never_preempted(env, obs_server, wait_until):
+    release = gate_after_first_piece(obs_server)
+    db, executor = env.executor()
+    futures = {}
+    for task_id, priority in (('p0', 0), ('p1', 1)):
+        obs_server.put(f'{task_id}.bin', os.urandom(512 * KB))
+        task = env.task(task_id, f'{task_id}.bin', piece_size=128 * KB, chunk_concurrency=1,
+                        priority=priority)
+        db.add_task(task_id, task)
+        assert executor.submit_task(task_id, task)
+        futures[task_id] = executor.running_tasks[task_id]['future']
+    wait_until(lambda: len(obs_server.gets) == 4)
+
+    assert executor.preempt_lowest(5, fits=lambda task_id: False) is None
+    db.update_task('p0', {'status': 'paused'})
+    assert executor.preempt_lowest(5) == 'p1'
+
+    db.update_task('p0', {'status': 'cancelled'})
+    release.set()
+    for future in futures.values():
+        future.result(10)
+    assert db.get_task('p0')['status'] == 'cancelled'
+    assert db.get_task('p1')['status'] == 'pending'
+
+
+def test_daemon_preempts_for_an_urgent_task_when_slots_are_full(env, obs_server, monkeypatch, wait_until):
+    monkeypatch.setattr(daemon, 'MAX_CONCURRENCY', 1)
+    obs_server.put('big.bin', os.urandom(512 * KB))
+    obs_server.put('urgent.bin', os.urandom(64 * KB))
+    release = gate_after_first_piece(obs_server)
+    instance = env.daemon()
+    instance.db.add_task('low', env.task('low', 'big.bin', piece_size=128 * KB, chunk_concurrency=1))
+    instance.process_pending_tasks(log_stats=False)
+    wait_until(lambda: len(obs_server.gets) == 2)
+
+    instance.db.add_task('urgent', env.task('urgent', 'urgent.bin', priority=9))
+    instance.process_pending_tasks(log_stats=False)
+    release.set()
+    wait_until(lambda: not instance.executor.is_running('low'))
+    assert instance.db.get_task('low')['status'] == 'pending'
+
+    instance.process_pending_tasks(log_stats=False)
+    wait_until(lambda: instance.db.get_task('urgent')['status'] == 'completed')
@@ -0,0 +1,79 @@
+"""Download progress is buffered in memory and written in one batch per interval."""
+import os
+
+from linux_server.daemon import ProgressBuffer
+
+KB = 1024
+
+
+def progress(downloaded):
+    return {'downloaded': downloaded, 'total': 100, 'percentage': downloaded}
+
+
+def test_reports_are_coalesced_into_one_batch(env):
+    db, executor = env.executor()
+    for task_id in ('t1', 't2'):
+        db.add_task(task_id, env.task(task_id, 'obj.bin', status='downloading'))
+    buffer = ProgressBuffer(db, interval=3600)
+
+    for downloaded in (10, 20, 30):
+        buffer.report('t1', progress(downloaded))
+    buffer.report('t2', progress(5))
+    assert 'progress' not in db.get_task('t1')
+    buffer.flush()
+
+    assert db.get_task('t1')['progress'] == progress(30)
+    assert db.get_task('t2')['progress'] == progress(5)
+    assert buffer.stats() == {'interval': 3600, 'pending': 0, 'flushes': 1, 'written': 2}
+    buffer.stop()
+
+
+def test_late_progress_does_not_overwrite_a_completed_task(env):
+    db, executor = env.executor()
+    db.add_task('t1', env.task('t1', 'obj.bin', status='completed', progress=progress(100)))
+    buffer = ProgressBuffer(db, interval=3600)
+
+    buffer.report('t1', progress(40))
+    buffer.flush()
+
+    assert db.get_task('t1')['progress'] == progress(100)
+    assert buffer.stats()['written'] == 0
+    buffer.stop()
+
+
+def test_discarded_progress_is_never_written(env):
+    db, executor = env.executor()
+    db.add_task('t1', env.task('t1', 'obj.bin', status='downloading'))
+    buffer = ProgressBuffer(db, interval=3600)
+
+    buffer.report('t1', progress(40))
+    buffer.discard('t1')
+    buffer.stop()
+
+    assert 'progress' not in db.get_task('t1')
+    assert buffer.stats()['flushes'] == 0
+
+
+def test_writer_thread_flushes_on_the_interval(env, wait_until):
+    db, executor = env.executor()
+    db.add_task('t1', env.task('t1', 'obj.bin', status='downloading'))
+    buffer = ProgressBuffer(db, interval=0.1)
+
+    buffer.report('t1', progress(40))
+
+    wait_until(lambda: db.get_task('t1').get('progress') == progress(40))
+    buffer.stop()
+
+
+def test_download_writes_final_progress_with_the_status_change(env, obs_server, status_store):
+    obs_server.put('obj.bin', os.urandom(1024 * KB))
+    db, executor = env.executor(progress_interval=3600)
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=64 * KB))
+    db.flush()
+
+    assert task['status'] == 'completed'
+    assert task['progress'] == {'downloaded': 1024 * KB, 'total': 1024 * KB, 'percentage': 100}
+    # 16 pieces, but no per-piece progress write reached the database
+    assert executor.progress.stats()['flushes'] == 0
+    assert status_store.get_task('t1')['status'] == 'completed'
@@ -0,0 +1,140 @@
+"""Resume state kept in a compact per-download manifest."""
+import errno
+import os
+
+from linux_server import daemon
+from linux_server.daemon import PartFileStore, PieceBitmap
+
+KB = 1024
+
+
+def write_piece(store, index, data):
+    start = (index - 1) * store.piece_size
+    with store.open_piece(index, start) as f:
+        f.write(data[start:start + store.piece_size])
+    store.mark_done(index)
+
+
+def test_bitmap_round_trips_through_the_manifest_file(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    bitmap = PieceBitmap(path, 128 * KB, 20 * 128 * KB, 'etag')
+    for index in (1, 9, 20):
+        bitmap.mark_done(index)
+    bitmap.clear(9)
+    bitmap.save()
+
+    loaded = PieceBitmap(path, 128 * KB, 20 * 128 * KB, 'etag')
+    assert loaded.load()
+    assert loaded.done_pieces() == [1, 20]
+    assert not PieceBitmap(path, 64 * KB, 20 * 128 * KB, 'etag').load()
+    assert not PieceBitmap(path, 128 * KB, 20 * 128 * KB, 'other').load()
+
+
+def test_manifest_writes_are_rate_limited(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    bitmap = PieceBitmap(path, 128 * KB, 256 * KB)
+    bitmap.mark_done(1)
+    bitmap.save_if_due(interval=60)
+    bitmap.mark_done(2)
+    bitmap.save_if_due(interval=60)
+
+    loaded = PieceBitmap(path, 128 * KB, 256 * KB)
+    assert loaded.load() and loaded.done_pieces() == [1]
+    bitmap.flush()
+    assert loaded.load() and loaded.done_pieces() == [1, 2]
+
+
+def test_scan_resumes_from_the_manifest(tmp_path):
+    data = os.urandom(300 * KB)
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    assert store.scan() == ([], [1, 2, 3])
+    write_piece(store, 1, data)
+    write_piece(store, 3, data)
+    store.close()
+
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    assert store.scan() == ([1, 3], [2])
+    store.close()
+
+
+def test_scan_redownloads_pieces_whose_part_files_are_gone(tmp_path):
+    data = os.urandom(300 * KB)
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    store.scan()
+    for index in (1, 2, 3):
+        write_piece(store, index, data)
+    store.close()
+    os.remove(store._part_path(1))
+    with open(store._part_path(2), 'r+b') as f:
+        f.truncate(10)
+
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    assert store.scan() == ([3], [1, 2])
+    store.close()
+    manifest = PieceBitmap(store.manifest.path, 128 * KB, len(data), 'etag')
+    assert manifest.load() and manifest.done_pieces() == [3]
+
+
+def test_scan_without_a_manifest_probes_part_files_once(tmp_path):
+    data = os.urandom(300 * KB)
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    store.scan()
+    write_piece(store, 2, data)
+    store.close()
+    os.remove(store.manifest.path)
+
+    store = PartFileStore('t1', str(tmp_path), 'obj.bin', 128 * KB, len(data), 'etag')
+    assert store.scan() == ([2], [1, 3])
+    assert os.path.exists(store.manifest.path)
+    store.close()
+
+
+def test_interrupted_download_fetches_only_missing_pieces(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+
+    def fail_last_piece(key, start, end):
+        if start == 384 * KB:
+            raise IOError('connection reset')
+
+    obs_server.hooks.append(fail_last_piece)
+    env.write_config(chunkConcurrency=1)
+    db, executor = env.executor()
+    task = env.task('t1', 'obj.bin', piece_size=128 * KB, maxRetries=1)
+
+    assert env.run(db, executor, task)['status'] == 'failed'
+
+    obs_server.hooks.clear()
+    del obs_server.gets[:]
+    assert env.run(db, executor, task)['status'] == 'completed'
+    assert obs_server.ranges() == [(384 * KB, 512 * KB - 1)]
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+
+
+def test_failed_merge_redownloads_the_parts_it_already_consumed(env, obs_server, monkeypatch):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+    copy_file_data = daemon.copy_file_data
+    copies = []
+
+    def disk_full_on_third_piece(fd_in, fd_out, count, buffer=None):
+        copies.append(count)
+        if len(copies) == 3:
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        return copy_file_data(fd_in, fd_out, count, buffer)
+
+    monkeypatch.setattr(daemon, 'copy_file_data', disk_full_on_third_piece)
+    db, executor = env.executor()
+    task = env.task('t1', 'obj.bin', piece_size=128 * KB)
+
+    failed = env.run(db, executor, task)
+    assert failed['status'] == 'failed'
+    assert '分片合并失败' in failed['error']
+    assert not os.path.exists(env.path('obj.bin'))
+
+    monkeypatch.setattr(daemon, 'copy_file_data', copy_file_data)
+    del obs_server.gets[:]
+    assert env.run(db, executor, task)['status'] == 'completed'
+    assert sorted(obs_server.ranges()) == [(0, 128 * KB - 1), (128 * KB, 256 * KB - 1)]
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(env.out) == ['obj.bin']
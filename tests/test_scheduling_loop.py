@@ -0,0 +1,70 @@
+"""The daemon schedules on events (new task, finished task, signal) rather than on a polling tick."""
+import json
+import os
+import signal
+import threading
+
+import pytest
+
+from linux_server import daemon
+
+KB = 1024
+MB = 1024 * KB
+
+
+@pytest.fixture
+def running_daemon(env, monkeypatch):
+    """A daemon main loop whose safety-net sweep and reload tick never fire during the test."""
+    monkeypatch.setattr(daemon, 'SCHEDULE_SWEEP_INTERVAL', 3600)
+    monkeypatch.setattr(daemon, 'RELOAD_CHECK_INTERVAL', 3600)
+    instance = env.daemon()
+    thread = threading.Thread(target=instance.run)
+    thread.start()
+    instance.thread = thread
+    yield instance
+    instance.running = False
+    instance.wake()
+    thread.join(10)
+
+
+def test_task_added_by_the_cli_starts_without_a_sweep(env, obs_server, status_store, running_daemon,
+                                                      wait_until):
+    obs_server.put('obj.bin', os.urandom(256 * KB))
+
+    status_store.add_task('t1', env.task('t1', 'obj.bin'))
+
+    wait_until(lambda: (running_daemon.db.get_task('t1') or {}).get('status') == 'completed')
+    latency = running_daemon.queue_latency_stats()
+    assert latency['samples'] == 1 and latency['max'] < 5
+    assert running_daemon.completion_stats()['samples'] == 1
+
+
+def test_finished_task_frees_its_slot_immediately(env, obs_server, running_daemon, monkeypatch,
+                                                  wait_until):
+    monkeypatch.setattr(daemon, 'MAX_CONCURRENCY', 1)
+    for i in range(3):
+        obs_server.put(f'obj{i}.bin', os.urandom(128 * KB))
+        running_daemon.db.add_task(f't{i}', env.task(f't{i}', f'obj{i}.bin'))
+
+    wait_until(lambda: running_daemon.db.count_by_status() == {'completed': 3})
+    assert running_daemon.queue_latency_stats()['samples'] == 3
+
+
+def test_sighup_reloads_limits_without_waiting_for_the_tick(running_daemon, wait_until):
+    with open(daemon.RATE_LIMITS_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'bandwidthLimitMBps': 3}, f)
+    running_daemon._rate_limits_mtime = os.path.getmtime(daemon.RATE_LIMITS_FILE)
+
+    running_daemon.handle_signal(signal.SIGHUP, None)
+
+    wait_until(lambda: running_daemon.executor.bandwidth.stats()['global_rate'] == 3 * MB)
+
+
+def test_sigterm_stops_the_loop_and_releases_the_lock(running_daemon):
+    running_daemon.handle_signal(signal.SIGTERM, None)
+    running_daemon.thread.join(5)
+
+    assert not running_daemon.thread.is_alive()
+    lock = daemon.WriteLock(daemon.LOCK_FILE)
+    assert lock.acquire(blocking=False)
+    lock.release()
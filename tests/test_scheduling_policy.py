@@ -0,0 +1,103 @@
+"""Size-aware dispatch policies: fifo, shortest remaining bytes first with aging, and hybrid."""
+import os
+import time
+
+from linux_server import daemon
+from linux_server.daemon import FairShareScheduler, latency_summary, obs_credentials
+
+KB = 1024
+
+
+def task(size, queued_at, downloaded=0, **fields):
+    return dict({'created_by': 'alice', 'total_size': size, 'queued_at': queued_at,
+                 'progress': {'downloaded': downloaded}}, **fields)
+
+
+def order(scheduler, pending, slots=None, **kwargs):
+    return [task_id for task_id, _ in scheduler.select(pending, {}, slots or len(pending), **kwargs)]
+
+
+def test_fifo_keeps_queue_order():
+    now = time.time()
+    pending = {'big': task(10 * KB, now - 2), 'small': task(KB, now - 1)}
+
+    assert order(FairShareScheduler(policy='fifo'), pending) == ['big', 'small']
+
+
+def test_srpt_runs_the_least_remaining_bytes_first():
+    now = time.time()
+    pending = {
+        'big': task(10 * KB, now - 4),
+        'unknown': task(0, now - 3),
+        'mostly_done': task(20 * KB, now - 2, downloaded=19 * KB),
+        'small': task(2 * KB, now - 1),
+    }
+
+    assert order(FairShareScheduler(policy='srpt'), pending) == ['mostly_done', 'small', 'big', 'unknown']
+
+
+def test_srpt_aging_lets_a_long_waiting_task_through():
+    now = time.time()
+    pending = {'old_big': task(64 * KB, now - 10), 'new_small': task(KB, now)}
+
+    assert order(FairShareScheduler(policy='srpt', aging=600), pending, slots=1) == ['new_small']
+    assert order(FairShareScheduler(policy='srpt', aging=1), pending, slots=1) == ['old_big']
+
+
+def test_hybrid_reserves_slots_for_large_jobs():
+    now = time.time()
+    pending = {'small1': task(KB, now - 3), 'small2': task(KB, now - 2), 'large': task(100 * KB, now - 1)}
+    scheduler = FairShareScheduler(policy='hybrid', large_threshold=50 * KB, large_slots=1)
+
+    assert order(scheduler, pending, slots=2) == ['large', 'small1']
+    assert order(scheduler, pending, slots=2, running_large=1) == ['small1', 'small2']
+
+
+def test_unknown_policy_falls_back_to_fifo():
+    assert FairShareScheduler(policy='lifo').policy == 'fifo'
+
+
+def test_latency_summary():
+    assert latency_summary([]) is None
+    summary = latency_summary(range(1, 101))
+    assert summary == {'mean': 50.5, 'p95': 96, 'max': 100, 'samples': 100}
+
+
+def test_credentials_come_from_config_before_the_environment(monkeypatch):
+    monkeypatch.setenv('OBS_ACCESS_KEY', 'env-ak')
+    monkeypatch.setenv('OBS_SECRET_KEY', 'env-sk')
+    monkeypatch.setenv('OBS_SERVER', 'https://env')
+
+    assert obs_credentials({}) == ('env-ak', 'env-sk', 'https://env')
+    assert obs_credentials({'accessKeyId': 'ak', 'secretAccessKey': 'sk', 'server': 'https://cfg'}) == \
+        ('ak', 'sk', 'https://cfg')
+
+
+def test_unknown_sizes_are_probed_once_with_the_download_client(env, obs_server, monkeypatch):
+    monkeypatch.setenv('OBS_ACCESS_KEY', 'env-ak')
+    env.write_config(accessKeyId='ak', secretAccessKey='sk', server='https://cfg')
+    obs_server.put('a.bin', os.urandom(300 * KB))
+    db, executor = env.executor()
+    pending = {'t1': env.task('t1', 'a.bin', total_size=0), 'missing': env.task('missing', 'nope.bin')}
+    for task_id, data in pending.items():
+        db.add_task(task_id, data)
+
+    assert executor.probe_sizes(pending) == 1
+    assert executor.probe_sizes(pending) == 0
+    assert obs_server.heads == 2
+    assert pending['t1']['total_size'] == db.get_task('t1')['total_size'] == 300 * KB
+
+    assert env.run(db, executor, db.get_task('t1'))['status'] == 'completed'
+    assert len(obs_server.clients) == 1
+    assert obs_server.clients[0].kwargs['access_key_id'] == 'ak'
+
+
+def test_completion_times_are_reported(env, obs_server):
+    instance = env.daemon()
+    instance.db.add_task('t1', env.task('t1', 'a.bin', created_at=time.time() - 5))
+
+    instance.db.update_task('t1', {'status': 'completed'})
+
+    stats = instance.completion_stats()
+    assert stats['samples'] == 1 and stats['mean'] >= 5
+    assert daemon.COMPLETION_WINDOW == instance.completion_times.maxlen
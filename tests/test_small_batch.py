@@ -0,0 +1,70 @@
+"""Small-object fast lane: folder syncs group small objects into one batch task."""
+import os
+
+KB = 1024
+
+
+def batch_task(env, obs_server, **fields):
+    objects = [{'key': key, 'size': len(obs_server.objects[key]), 'etag': obs_server.etags[key]}
+               for key in sorted(obs_server.objects)]
+    return env.task('batch', 'data', type='small_batch', objects=objects,
+                    total_size=sum(o['size'] for o in objects), **fields)
+
+
+def test_sync_groups_small_objects_into_one_task(env, obs_server, folder_sync, status_store):
+    for i in range(3):
+        obs_server.put(f'data/small{i}.txt', os.urandom(10 * KB))
+    obs_server.put('data/big.bin', os.urandom(128 * KB))
+
+    task_ids = folder_sync.batch_create_tasks('bucket', 'data/', env.out, 'tester',
+                                              small_threshold=64 * KB)
+
+    tasks = [status_store.get_task(task_id) for task_id in task_ids]
+    assert sorted(task['type'] for task in tasks) == ['single_file', 'small_batch']
+    batch = next(task for task in tasks if task['type'] == 'small_batch')
+    assert [o['key'] for o in batch['objects']] == [f'data/small{i}.txt' for i in range(3)]
+    assert batch['total_size'] == 30 * KB
+
+
+def test_batch_fetches_each_object_with_one_get_and_no_head(env, obs_server):
+    for i in range(5):
+        obs_server.put(f'data/f{i}.txt', os.urandom(i * KB + 1))
+    obs_server.put('data/empty.txt', b'')
+    db, executor = env.executor()
+
+    task = env.run(db, executor, batch_task(env, obs_server))
+
+    assert task['status'] == 'completed'
+    assert obs_server.heads == 0
+    assert len(obs_server.gets) == 5
+    for key, data in obs_server.objects.items():
+        with open(env.path(os.path.basename(key)), 'rb') as f:
+            assert f.read() == data
+    assert task['progress']['files_done'] == 6
+    assert sorted(os.listdir(env.out)) == sorted(os.path.basename(k) for k in obs_server.objects)
+
+
+def test_batch_skips_files_already_on_disk(env, obs_server):
+    for i in range(3):
+        obs_server.put(f'data/f{i}.txt', os.urandom(4 * KB))
+    os.makedirs(env.out)
+    with open(env.path('f1.txt'), 'wb') as f:
+        f.write(obs_server.objects['data/f1.txt'])
+    db, executor = env.executor()
+
+    task = env.run(db, executor, batch_task(env, obs_server))
+
+    assert task['status'] == 'completed'
+    assert sorted(key for key, start, end in obs_server.gets) == ['data/f0.txt', 'data/f2.txt']
+
+
+def test_corrupt_object_fails_the_batch_but_keeps_the_others(env, obs_server):
+    obs_server.put('data/good.txt', os.urandom(4 * KB))
+    obs_server.put('data/bad.txt', os.urandom(4 * KB), etag='0' * 32)
+    db, executor = env.executor()
+
+    task = env.run(db, executor, batch_task(env, obs_server, maxRetries=1))
+
+    assert task['status'] == 'failed'
+    assert task['failed_objects'] == ['data/bad.txt']
+    assert os.listdir(env.out) == ['good.txt']
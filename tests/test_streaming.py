@@ -0,0 +1,109 @@
+"""Streaming range bodies to disk through a bounded buffer pool."""
+import hashlib
+import io
+import os
+import threading
+import types
+
+import pytest
+
+from linux_server.daemon import BufferPool, stream_response_body
+
+KB = 1024
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.blocks = []
+
+    def write(self, data):
+        self.blocks.append(bytes(data))
+        return len(data)
+
+
+class ReadOnlyStream:
+    """A stream without readinto, like some SDK response wrappers."""
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+        self.closed = False
+
+    def read(self, n):
+        return self._stream.read(n)
+
+    def close(self):
+        self.closed = True
+
+
+def response(stream=None, buffer=None):
+    return types.SimpleNamespace(body=types.SimpleNamespace(response=stream, buffer=buffer))
+
+
+def test_pool_never_allocates_past_its_memory_limit():
+    pool = BufferPool(64 * KB, 128 * KB)
+    first, second = pool.acquire(), pool.acquire()
+    assert len(first) == 64 * KB and first is not second
+
+    abort = threading.Event()
+    threading.Timer(0.1, abort.set).start()
+    assert pool.acquire(abort) is None
+
+    pool.release(first)
+    assert pool.acquire() is first
+    assert pool.stats()['allocated'] == 2
+    assert pool.stats()['waits'] == 1
+
+
+def test_blocked_acquire_gets_a_released_buffer():
+    pool = BufferPool(64 * KB, 64 * KB)
+    buffer = pool.acquire()
+    threading.Timer(0.1, pool.release, args=(buffer,)).start()
+    assert pool.acquire() is buffer
+
+
+@pytest.mark.parametrize('make_stream', [io.BytesIO, ReadOnlyStream])
+def test_body_is_written_in_buffer_sized_blocks(make_stream):
+    data = os.urandom(200 * KB + 1)
+    stream = make_stream(data)
+    writer = RecordingWriter()
+    digest = hashlib.md5()
+    throttled = []
+
+    written = stream_response_body(response(stream), writer, bytearray(64 * KB),
+                                   throttle=throttled.append, digest=digest)
+
+    assert written == len(data)
+    assert b''.join(writer.blocks) == data
+    assert max(len(block) for block in writer.blocks) == 64 * KB
+    assert sum(throttled) == len(data)
+    assert digest.hexdigest() == hashlib.md5(data).hexdigest()
+    assert stream.closed
+
+
+def test_body_loaded_in_memory_is_written_in_blocks():
+    data = os.urandom(130 * KB)
+    writer = RecordingWriter()
+    assert stream_response_body(response(buffer=data), writer, bytearray(64 * KB)) == len(data)
+    assert [len(block) for block in writer.blocks] == [64 * KB, 64 * KB, 2 * KB]
+
+
+def test_abort_stops_reading_and_closes_the_stream():
+    stream = io.BytesIO(os.urandom(128 * KB))
+    abort = threading.Event()
+    abort.set()
+    with pytest.raises(RuntimeError):
+        stream_response_body(response(stream), RecordingWriter(), bytearray(64 * KB), abort)
+    assert stream.closed
+
+
+def test_download_memory_stays_within_the_pool(env, obs_server):
+    data = obs_server.put('obj.bin', os.urandom(1024 * KB))
+    env.write_config(chunkConcurrency=8)
+    db, executor = env.executor(max_buffer_memory=128 * KB)
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB))
+
+    assert task['status'] == 'completed'
+    assert executor.buffer_pool.stats()['allocated'] <= 2
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
@@ -0,0 +1,113 @@
+"""Pause, resume and cancel reach running downloads through an in-memory control channel."""
+import io
+import os
+import threading
+import time
+import types
+
+import pytest
+
+from linux_server.daemon import TaskControl, TaskPaused, stream_response_body
+
+KB = 1024
+
+
+def test_checkpoint_blocks_while_paused():
+    control = TaskControl()
+    assert control.pause() and not control.pause()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(control.checkpoint()))
+    thread.start()
+    thread.join(0.2)
+    assert thread.is_alive()
+
+    assert control.resume()
+    thread.join(5)
+    assert results == [None]
+    assert not control.paused.is_set()
+
+
+def test_cancel_wakes_a_paused_checkpoint():
+    control = TaskControl()
+    control.pause()
+    threading.Timer(0.1, control.cancel).start()
+
+    assert control.checkpoint() == 'cancelled'
+    assert control.abort.is_set()
+    assert not control.resume()
+
+
+def test_preempt_leaves_a_paused_task_paused():
+    control = TaskControl()
+    control.pause()
+    assert not control.preempt()
+    assert control.state == 'paused' and not control.abort.is_set()
+
+    control.resume()
+    assert control.preempt()
+    assert control.checkpoint() == 'preempted'
+
+
+def test_pause_interrupts_a_body_between_blocks():
+    paused = threading.Event()
+    stream = io.BytesIO(os.urandom(256 * KB))
+    written = []
+
+    class Writer:
+        def write(self, data):
+            written.append(len(data))
+            paused.set()
+
+    resp = types.SimpleNamespace(body=types.SimpleNamespace(response=stream, buffer=None))
+    with pytest.raises(TaskPaused):
+        stream_response_body(resp, Writer(), bytearray(64 * KB), paused=paused)
+    assert written == [64 * KB]
+
+
+def test_paused_download_resumes_where_it_stopped(env, obs_server, wait_until):
+    data = obs_server.put('obj.bin', os.urandom(512 * KB))
+    db, executor = env.executor()
+
+    paused = []
+
+    def pause_on_second_piece(key, start, end):
+        if start == 128 * KB and not paused:
+            paused.append(start)
+            db.update_task('t1', {'status': 'paused'})
+
+    obs_server.hooks.append(pause_on_second_piece)
+    task = env.task('t1', 'obj.bin', piece_size=128 * KB, chunk_concurrency=1)
+    thread = threading.Thread(target=env.run, args=(db, executor, task))
+    thread.start()
+
+    wait_until(lambda: db.get_task('t1')['status'] == 'paused'
+               and executor.controls['t1'].paused.is_set())
+    time.sleep(0.2)
+    assert len(obs_server.gets) == 2
+    db.update_task('t1', {'status': 'pending'})
+    thread.join(10)
+
+    assert db.get_task('t1')['status'] == 'completed'
+    # Only the interrupted piece may be fetched again
+    ranges = obs_server.ranges()
+    assert sorted(set(ranges)) == [(i * 128 * KB, (i + 1) * 128 * KB - 1) for i in range(4)]
+    assert len(ranges) - len(set(ranges)) <= 1
+    with open(env.path('obj.bin'), 'rb') as f:
+        assert f.read() == data
+
+
+def test_cancel_stops_the_download_without_fetching_more_pieces(env, obs_server):
+    obs_server.put('obj.bin', os.urandom(512 * KB))
+    db, executor = env.executor()
+
+    def cancel_on_second_piece(key, start, end):
+        if start == 128 * KB:
+            db.update_task('t1', {'status': 'cancelled'})
+
+    obs_server.hooks.append(cancel_on_second_piece)
+
+    task = env.run(db, executor, env.task('t1', 'obj.bin', piece_size=128 * KB, chunk_concurrency=1))
+
+    assert task['status'] == 'cancelled'
+    assert obs_server.ranges() == [(0, 128 * KB - 1), (128 * KB, 256 * KB - 1)]
+    assert not os.path.exists(env.path('obj.bin'))
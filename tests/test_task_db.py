@@ -0,0 +1,98 @@
+"""Tasks in an indexed SQLite database (WAL mode) shared by the daemon and the CLI."""
+import json
+import os
+import stat
+
+import pytest
+
+from linux_server import daemon, task_db
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@pytest.fixture
+def restrictive_umask():
+    old = os.umask(0o077)
+    yield
+    os.umask(old)
+
+
+def test_database_files_are_shared_despite_the_umask(tmp_path, restrictive_umask):
+    db_file = str(tmp_path / 'tasks.db')
+    conn = task_db.connect(db_file)
+    with task_db.transaction(conn):
+        conn.execute(task_db.UPSERT_TASK, task_db.task_row('t1', {'status': 'pending'}))
+
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    for suffix in ('', '-wal', '-shm'):
+        assert mode(db_file + suffix) == task_db.SHARED_MODE
+    conn.close()
+
+
+def test_failed_transaction_is_rolled_back(tmp_path):
+    conn = task_db.connect(str(tmp_path / 'tasks.db'))
+    with pytest.raises(RuntimeError):
+        with task_db.transaction(conn):
+            conn.execute(task_db.UPSERT_TASK, task_db.task_row('t1', {'status': 'pending'}))
+            raise RuntimeError('boom')
+    assert conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0] == 0
+    conn.close()
+
+
+def test_history_keeps_only_the_newest_entries(tmp_path):
+    conn = task_db.connect(str(tmp_path / 'tasks.db'))
+    for i in range(task_db.HISTORY_LIMIT + 5):
+        task_db.insert_history(conn, {'task_id': f't{i}'})
+    rows = [json.loads(data)['task_id']
+            for (data,) in conn.execute('SELECT data FROM history ORDER BY seq')]
+    assert len(rows) == task_db.HISTORY_LIMIT
+    assert rows[0] == 't5'
+    conn.close()
+
+
+def test_legacy_json_is_imported_once(tmp_path):
+    (tmp_path / 'tasks_db.json').write_text(json.dumps({'t1': {'status': 'pending', 'created_at': 1}}))
+    (tmp_path / 'history.json').write_text(json.dumps([{'task_id': f'h{i}'} for i in range(150)]))
+    (tmp_path / 'downloads.json').write_text(json.dumps({'/data/a': {'size': 1}}))
+    conn = task_db.connect(str(tmp_path / 'tasks.db'))
+
+    result = task_db.migrate_json(conn, str(tmp_path))
+
+    assert result['tasks'] == 1 and len(result['files']) == 3 and result['errors'] == []
+    assert conn.execute('SELECT status FROM tasks WHERE id = ?', ('t1',)).fetchone() == ('pending',)
+    assert conn.execute('SELECT COUNT(*) FROM history').fetchone()[0] == task_db.HISTORY_LIMIT
+    assert conn.execute('SELECT path FROM downloads').fetchall() == [('/data/a',)]
+    assert sorted(os.listdir(tmp_path))[:3] == ['downloads.json.migrated', 'history.json.migrated',
+                                                'tasks.db']
+    assert task_db.migrate_json(conn, str(tmp_path))['tasks'] is None
+    conn.close()
+
+
+def test_cli_writes_reach_the_daemon(env, status_store, wait_until):
+    db, executor = env.executor()
+    status_store.add_task('cli1', env.task('cli1', 'obj.bin'))
+
+    wait_until(lambda: db.get_task('cli1') is not None)
+    assert db.get_task('cli1')['status'] == 'pending'
+
+    db.update_task('cli1', {'status': 'completed'})
+    db.flush()
+    assert status_store.get_task('cli1')['status'] == 'completed'
+
+
+def test_second_daemon_is_refused_before_touching_the_database(env):
+    legacy = os.path.join(env.storage, 'tasks_db.json')
+    with open(legacy, 'w', encoding='utf-8') as f:
+        json.dump({'t1': {'status': 'pending'}}, f)
+    running = daemon.WriteLock(daemon.LOCK_FILE)
+    assert running.acquire(blocking=False)
+    try:
+        with pytest.raises(RuntimeError):
+            env.daemon()
+    finally:
+        running.release()
+
+    assert os.path.exists(legacy)
+    assert not os.path.exists(os.path.join(env.storage, 'tasks.db'))
@@ -0,0 +1,108 @@
+"""DatabaseManager serves reads from memory and group-commits writes on one thread."""
+import contextlib
+import threading
+
+from linux_server import task_db
+
+
+@contextlib.contextmanager
+def held_commits(monkeypatch):
+    """Block the committer inside its next transaction until the returned event is set."""
+    release = threading.Event()
+    transaction = task_db.transaction
+
+    @contextlib.contextmanager
+    def gated(conn):
+        release.wait(10)
+        with transaction(conn) as c:
+            yield c
+
+    monkeypatch.setattr(task_db, 'transaction', gated)
+    try:
+        yield release
+    finally:
+        release.set()
+
+
+def test_reads_see_writes_before_they_are_committed(env, status_store, monkeypatch):
+    db, executor = env.executor()
+    assert status_store.get_tasks() == {}  # open the CLI-side connection before holding commits
+    with held_commits(monkeypatch) as release:
+        db.add_task('t1', env.task('t1', 'obj.bin'))
+        db.update_task('t1', {'status': 'downloading'})
+
+        assert db.get_task('t1')['status'] == 'downloading'
+        assert db.count_by_status() == {'downloading': 1}
+        assert status_store.get_task('t1') is None
+        release.set()
+        assert db.flush()
+
+    assert status_store.get_task('t1')['status'] == 'downloading'
+
+
+def test_queued_writes_are_group_committed(env, status_store, monkeypatch):
+    db, executor = env.executor()
+    db.add_task('t0', env.task('t0', 'obj.bin'))
+    db.flush()
+    commits = db.stats()['commits']
+    with held_commits(monkeypatch) as release:
+        for i in range(1, 50):
+            db.add_task(f't{i}', env.task(f't{i}', 'obj.bin'))
+        db.add_history({'task_id': 't1'})
+        release.set()
+        assert db.flush()
+
+    assert db.stats()['commits'] - commits <= 2
+    assert db.stats()['pending'] == 0
+    assert len(status_store.get_tasks()) == 50
+    assert status_store.get_history() and status_store.get_history()[0]['task_id'] == 't1'
+
+
+def test_failed_commit_is_retried(env, status_store, monkeypatch):
+    db, executor = env.executor()
+    transaction = task_db.transaction
+    failures = []
+
+    @contextlib.contextmanager
+    def flaky(conn):
+        if not failures:
+            failures.append(1)
+            raise OSError('disk I/O error')
+        with transaction(conn) as c:
+            yield c
+
+    monkeypatch.setattr(task_db, 'transaction', flaky)
+    db.add_task('t1', env.task('t1', 'obj.bin'))
+    db.update_task('t1', {'status': 'paused'})
+
+    assert db.flush()
+    assert failures
+    assert status_store.get_task('t1')['status'] == 'paused'
+
+
+def test_external_writes_are_reloaded_and_notified(env, status_store, wait_until):
+    db, executor = env.executor()
+    changes = []
+    db.add_listener(lambda task_id, status: changes.append((task_id, status)))
+    db.add_task('t1', env.task('t1', 'obj.bin', status='downloading'))
+    db.flush()
+
+    status_store.update_task('t1', {'status': 'paused'})
+    status_store.add_task('t2', env.task('t2', 'obj.bin'))
+
+    wait_until(lambda: db.get_task('t1')['status'] == 'paused' and db.get_task('t2'))
+    assert ('t1', 'paused') in changes and ('t2', 'pending') in changes
+    assert db.stats()['reloads'] >= 1
+
+
+def test_delete_and_close_commit_remaining_writes(env, status_store):
+    db, executor = env.executor()
+    db.add_task('t1', env.task('t1', 'obj.bin'))
+    db.add_task('t2', env.task('t2', 'obj.bin'))
+    assert db.delete_task('t1')
+    assert not db.delete_task('missing')
+    assert not db.update_task('missing', {'status': 'paused'})
+
+    db.close()
+
+    assert list(status_store.get_tasks()) == ['t2']
@@ -34,6 +34,9 @@ ICONS = {
     'unknown': '📎'
 }
 
+# 任务优先级（cli.py --priority）：越大越先调度，槽位已满时可抢占低优先级的运行中任务
+PRIORITY_LEVELS = {'普通': 0, '高': 5, '紧急': 10}
+
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "settings.json")
 
 def load_config():
@@ -492,6 +495,12 @@ class FileBrowserDialog:
         
         IconButton(time_frame, icon='🔍', text='筛选', 
                   command=self.apply_time_filter).pack(side=tk.LEFT, padx=5)
+        
+        # 下载/同步的任务优先级
+        tk.Label(time_frame, text="优先级:", font=('微软雅黑', 10),
+                bg='white', fg='#666666').pack(side=tk.LEFT, padx=(15, 0))
+        self.priority_var = tk.StringVar(value='普通')
+        tk.OptionMenu(time_frame, self.priority_var, *PRIORITY_LEVELS).pack(side=tk.LEFT, padx=5)
     
     def on_frame_configure(self, event=None):
         self.canvas.configure(scrollregion=self.canvas.bbox("all"))
@@ -813,7 +822,7 @@ class FileBrowserDialog:
         )
         
         if target:
-            self.start_download(key, target)
+            self.start_download(key, target, PRIORITY_LEVELS[self.priority_var.get()])
             self.dialog.destroy()
     
     def apply_time_filter(self):
@@ -849,16 +858,16 @@ class FileBrowserDialog:
         
         if messagebox.askyesno("确认同步", msg):
             target = self.config.get('download_path', '/railway-efs/000-tfds/')
-            self.sync_folder(folder_path, target, date_str)
+            self.sync_folder(folder_path, target, date_str, PRIORITY_LEVELS[self.priority_var.get()])
             self.dialog.destroy()
     
-    def start_download(self, object_key, target_dir):
+    def start_download(self, object_key, target_dir, priority=0):
         """开始下载"""
         try:
             cmd = [
                 'cd "/Users/wangxinchao/PycharmProjects/obs_tool" ',
                 'source /opt/anaconda3/bin/activate base',
-                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py download --object_key '{object_key}' --target_dir '{target_dir}' --created_by 'windows_user'",
+                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py download --object_key '{object_key}' --target_dir '{target_dir}' --created_by 'windows_user' --priority {int(priority)}",
             ]
             cmd = ';'.join(cmd)
             out, err = self.ssh.exec(cmd)
@@ -874,13 +883,13 @@ class FileBrowserDialog:
         except Exception as e:
             messagebox.showerror("错误", f"操作失败: {str(e)}")
     
-    def sync_folder(self, folder_path, target_dir, date_filter=None):
+    def sync_folder(self, folder_path, target_dir, date_filter=None, priority=0):
         """同步文件夹"""
         try:
             cmd = [
                 'cd "/Users/wangxinchao/PycharmProjects/obs_tool" ',
                 'source /opt/anaconda3/bin/activate base',
-                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py sync-folder --bucket tfds --prefix '{folder_path}/' --target-dir '{target_dir}'",
+                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py sync-folder --bucket tfds --prefix '{folder_path}/' --target-dir '{target_dir}' --priority {int(priority)}",
             ]
             if date_filter:
                 try:
@@ -896,8 +905,12 @@ class FileBrowserDialog:
                 messagebox.showerror("错误", f"启动同步失败:\n{err}")
             else:
                 result = json.loads(out)
-                task_count = len(result.get('tasks', []))
-                messagebox.showinfo("成功", f"✅ 同步任务已创建\n共 {task_count} 个文件")
+                scheduled = result.get('scheduled', len(result.get('tasks', [])))
+                skipped = result.get('skipped', 0)
+                messagebox.showinfo("成功", f"✅ 同步任务已创建\n共 {scheduled} 个文件需要下载"
+                                          f"（{self.format_size(result.get('scheduled_bytes', 0))}）\n"
+                                          f"跳过 {skipped} 个本地已一致的文件"
+                                          f"（{self.format_size(result.get('skipped_bytes', 0))}）")
                 self.refresh_tasks()
                 
         except Exception as e:
@@ -1079,7 +1092,7 @@ class MainApplication:
         """显示下载对话框"""
         dialog = tk.Toplevel(self.master)
         dialog.title("新建下载任务")
-        dialog.geometry("600x350")
+        dialog.geometry("600x420")
         dialog.configure(bg='white')
         dialog.transient(self.master)
         dialog.grab_set()
@@ -1111,6 +1124,12 @@ class MainApplication:
         entry_target.pack(fill=tk.X, ipady=5)
         entry_target.insert(0, self.config.get('download_path', '/railway-efs/000-tfds/'))
         
+        tk.Label(form_frame, text="优先级:", font=('微软雅黑', 11),
+                bg='white', fg='#333333').pack(anchor='w', pady=(15, 5))
+        
+        priority_var = tk.StringVar(value='普通')
+        tk.OptionMenu(form_frame, priority_var, *PRIORITY_LEVELS).pack(anchor='w')
+        
         btn_frame = tk.Frame(dialog, bg='white', pady=30)
         btn_frame.pack()
         
@@ -1120,7 +1139,7 @@ class MainApplication:
             if not path:
                 messagebox.showwarning("提示", "请输入OBS文件路径")
                 return
-            self.start_download(path, target)
+            self.start_download(path, target, PRIORITY_LEVELS[priority_var.get()])
             dialog.destroy()
         
         IconButton(btn_frame, icon='✓', text='开始下载', command=on_submit).pack(side=tk.LEFT, padx=5)
@@ -1135,13 +1154,13 @@ class MainApplication:
         except:
             pass
     
-    def start_download(self, object_key, target_dir):
+    def start_download(self, object_key, target_dir, priority=0):
         """开始下载"""
         try:
             cmd = [
                 'cd "/Users/wangxinchao/PycharmProjects/obs_tool" ',
                 'source /opt/anaconda3/bin/activate base',
-                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py download --object_key '{object_key}' --target_dir '{target_dir}' --created_by 'windows_user'",
+                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py download --object_key '{object_key}' --target_dir '{target_dir}' --created_by 'windows_user' --priority {int(priority)}",
             ]
             cmd = ';'.join(cmd)
             out, err = self.ssh.exec(cmd)
@@ -1157,13 +1176,13 @@ class MainApplication:
         except Exception as e:
             messagebox.showerror("错误", f"操作失败: {str(e)}")
     
-    def sync_folder(self, folder_path, target_dir, date_filter=None):
+    def sync_folder(self, folder_path, target_dir, date_filter=None, priority=0):
         """同步文件夹"""
         try:
             cmd = [
                 'cd "/Users/wangxinchao/PycharmProjects/obs_tool" ',
                 'source /opt/anaconda3/bin/activate base',
-                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py sync-folder --bucket tfds --prefix '{folder_path}/' --target-dir '{target_dir}'",
+                f"python /Users/wangxinchao/PycharmProjects/obs_tool/linux_server/cli.py sync-folder --bucket tfds --prefix '{folder_path}/' --target-dir '{target_dir}' --priority {int(priority)}",
             ]
             
             if date_filter:
@@ -1180,8 +1199,12 @@ class MainApplication:
                 messagebox.showerror("错误", f"启动同步失败:\n{err}")
             else:
                 result = json.loads(out)
-                task_count = len(result.get('tasks', []))
-                messagebox.showinfo("成功", f"✅ 同步任务已创建\n共 {task_count} 个文件")
+                scheduled = result.get('scheduled', len(result.get('tasks', [])))
+                skipped = result.get('skipped', 0)
+                messagebox.showinfo("成功", f"✅ 同步任务已创建\n共 {scheduled} 个文件需要下载"
+                                          f"（{self.format_size(result.get('scheduled_bytes', 0))}）\n"
+                                          f"跳过 {skipped} 个本地已一致的文件"
+                                          f"（{self.format_size(result.get('skipped_bytes', 0))}）")
                 self.refresh_tasks()
                 
         except Exception as e:
@@ -1221,10 +1244,10 @@ class MainApplication:
             empty.pack(pady=50)
             return
         
-        status_order = {'running': 0, 'pending': 1, 'paused': 2}
+        status_order = {'running': 0, 'attached': 0, 'pending': 1, 'paused': 2}
         sorted_tasks = sorted(
             tasks.items(),
-            key=lambda x: (status_order.get(x[1].get('status'), 99), x[0])
+            key=lambda x: (status_order.get(x[1].get('status'), 99), -int(x[1].get('priority') or 0), x[0])
         )
         
         for task_id, task in sorted_tasks:
@@ -1237,6 +1260,8 @@ class MainApplication:
         item_frame.pack_propagate(False)
         
         name = task.get('object_key', '未知文件').split('/')[-1]
+        if int(task.get('priority') or 0) > 0:
+            name = f"⚡ {name}"
         tk.Label(item_frame, text=name, font=('微软雅黑', 11),
                 bg='white', fg='#333333', anchor='w').place(x=20, y=18, width=280)
         
@@ -1288,6 +1313,7 @@ class MainApplication:
             'running': ('运行中', '#52c41a'),
             'pending': ('等待中', '#faad14'),
             'paused': ('已暂停', '#1890ff'),
+            'attached': ('共享下载', '#52c41a'),
             'completed': ('已完成', '#52c41a'),
             'failed': ('失败', '#ff4d4f'),
             'cancelled': ('已取消', '#999999')